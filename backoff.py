@@ -0,0 +1,200 @@
+"""
+Модуль отсрочки проверок после капчи и блокировок.
+Считает неудачи подряд по каждому запросу и общие блокировки подряд.
+После серии блокировок "размыкает цепь": все загрузки приостанавливаются
+на время охлаждения, которое растёт экспоненциально. Состояние хранится
+в базе (таблица backoff_state): оно общее для всех процессов с этой базой
+(python main.py worker --processes N) и переживает перезапуск программы.
+"""
+import random
+import time
+from datetime import datetime
+
+# Статусы проверки (см. AvitoTracker._run_check)
+SUCCESS_STATUSES = ("ok", "empty")
+BLOCK_STATUSES = ("blocked",)
+# Неудачи, которые откладывают только сам запрос (не похожи на блокировку).
+# "timeout" (объявления не дождались - медленная сеть или страница) не
+# откладывает запрос: это не признак проблемы с самим запросом.
+# Прочие статусы ("no_driver" - не запустился браузер, "skipped") -
+# местные проблемы, они не учитываются
+FAILURE_STATUSES = ("error",)
+
+GLOBAL_KEY = "global"
+# last_status общей записи, пока идёт пробная загрузка после охлаждения
+PROBE_STATUS = "probe"
+
+
+class BackoffController:
+    """
+    Экспоненциальная отсрочка по запросам и общий "предохранитель".
+    Состояние не кэшируется: каждая проверка читает его из базы, а запись
+    атомарна (Database.update_backoff_states), поэтому блокировку,
+    замеченную одним обработчиком очереди, сразу видят остальные
+    процессы на той же машине.
+    Args:
+        db: Database (таблица backoff_state).
+        base_minutes: Отсрочка запроса после первой неудачи; после каждой
+            следующей неудачи подряд удваивается.
+        max_minutes: Максимальная отсрочка запроса.
+        global_threshold: Сколько блокировок подряд (по любым запросам)
+            размыкают цепь.
+        global_cooldown_minutes: Охлаждение после размыкания; при новой
+            блокировке сразу после охлаждения удваивается.
+        global_max_minutes: Максимальное охлаждение.
+        probe_minutes: Сколько ждать результата пробной загрузки после
+            охлаждения (если проверивший процесс завершился аварийно).
+        jitter: Случайное отклонение отсрочки (доля).
+    """
+
+    def __init__(self, db, base_minutes=15, max_minutes=12 * 60,
+                 global_threshold=3, global_cooldown_minutes=30,
+                 global_max_minutes=6 * 60, probe_minutes=5, jitter=0.2):
+        self.db = db
+        self.base_minutes = base_minutes
+        self.max_minutes = max_minutes
+        self.global_threshold = global_threshold
+        self.global_cooldown_minutes = global_cooldown_minutes
+        self.global_max_minutes = global_max_minutes
+        self.probe_minutes = probe_minutes
+        self.jitter = jitter
+
+    def is_open(self):
+        """Разомкнута ли цепь (все загрузки приостановлены; в том числе
+        пока идёт пробная загрузка)"""
+        return self._remaining(GLOBAL_KEY) > 0
+
+    def resume_time(self, search_id=None):
+        """Время (timestamp), раньше которого запрос (или любая загрузка)
+        не будет выполнен, или None"""
+        until = [self._load(GLOBAL_KEY)[1]]
+        if search_id is not None:
+            until.append(self._load(self._key(search_id))[1])
+        until = [value for value in until if value and value > time.time()]
+        return max(until) if until else None
+
+    def allow_search(self, search_id):
+        """Не отложен ли запрос после своих неудач"""
+        return self._remaining(self._key(search_id)) <= 0
+
+    def allow_fetch(self):
+        """
+        Можно ли сейчас загружать страницу (цепь замкнута).
+        После охлаждения разрешает одну пробную загрузку (одну на все
+        процессы); остальные ждут её результата (record).
+        """
+        failures, blocked_until = self._load(GLOBAL_KEY)
+        if blocked_until and blocked_until > time.time():
+            return False
+        if failures < self.global_threshold:
+            return True
+
+        granted = []
+
+        def claim_probe(_key, failures, blocked_until, _status):
+            # Другой процесс мог взять пробу между чтением и транзакцией
+            blocked_until = self._timestamp(blocked_until)
+            if blocked_until and blocked_until > time.time():
+                return None
+            granted.append(True)
+            if failures < self.global_threshold:
+                return None
+            # До результата пробы цепь для остальных остаётся разомкнутой
+            return (failures,
+                    self._db_time(time.time() + self.probe_minutes * 60),
+                    PROBE_STATUS)
+
+        self.db.update_backoff_states([GLOBAL_KEY], claim_probe)
+        return bool(granted)
+
+    def record(self, search_ids, status):
+        """
+        Учёт результата одной загрузки (общей для search_ids).
+        Успех сбрасывает счётчики, блокировка откладывает запросы и
+        увеличивает общий счётчик, прочие неудачи откладывают только
+        запросы. Любой результат завершает пробную загрузку.
+        """
+        keys = [self._key(search_id) for search_id in search_ids]
+        if status in SUCCESS_STATUSES:
+            keys.append(GLOBAL_KEY)
+
+            def update(_key, failures, _blocked_until, _status):
+                if failures == 0:
+                    return None  # Нечего сбрасывать (без лишней записи)
+                return 0, None, status
+        elif status in BLOCK_STATUSES or status in FAILURE_STATUSES:
+            keys.append(GLOBAL_KEY)
+
+            def update(key, failures, blocked_until, last_status):
+                if key != GLOBAL_KEY:
+                    return self._fail(key, failures, status,
+                                      self.base_minutes, self.max_minutes)
+                if status in BLOCK_STATUSES:
+                    return self._fail(key, failures, status,
+                                      self.global_cooldown_minutes,
+                                      self.global_max_minutes,
+                                      threshold=self.global_threshold)
+                return self._end_probe(failures, last_status, status)
+        else:
+            keys = [GLOBAL_KEY]
+
+            def update(_key, failures, _blocked_until, last_status):
+                return self._end_probe(failures, last_status, status)
+
+        self.db.update_backoff_states(keys, update)
+
+    def _fail(self, key, failures, status, base_minutes, max_minutes,
+              threshold=1):
+        """Неудача подряд: после threshold неудач - отсрочка, растущая
+        вдвое с каждой следующей. Возвращает новое состояние ключа"""
+        failures += 1
+        blocked_until = None
+        if failures >= threshold:
+            minutes = min(base_minutes * 2 ** (failures - threshold),
+                          max_minutes)
+            minutes *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            blocked_until = time.time() + minutes * 60
+            label = "Все загрузки" if key == GLOBAL_KEY else f"'{key}'"
+            print(f"{label}: отсрочка на {minutes:.0f} мин "
+                  f"(неудач подряд: {failures})")
+        return failures, self._db_time(blocked_until), status
+
+    @staticmethod
+    def _end_probe(failures, last_status, status):
+        """Проба закончилась не успехом и не блокировкой - следующая
+        загрузка снова может стать пробной"""
+        if last_status != PROBE_STATUS:
+            return None
+        return failures, None, status
+
+    def _load(self, key):
+        """(неудачи подряд, окончание отсрочки (timestamp или None))"""
+        row = self.db.get_backoff_state(key)
+        if row is None:
+            return 0, None
+        return row[0], self._timestamp(row[1])
+
+    def _remaining(self, key):
+        blocked_until = self._load(key)[1]
+        return blocked_until - time.time() if blocked_until else 0
+
+    @staticmethod
+    def _key(search_id):
+        return f"search:{search_id}"
+
+    def _timestamp(self, value):
+        """Строка времени MSK из базы -> timestamp (или None)"""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(
+                tzinfo=self.db.MSK_TIMEZONE).timestamp()
+        except ValueError:
+            return None
+
+    def _db_time(self, timestamp):
+        """timestamp -> строка времени MSK для базы"""
+        if timestamp is None:
+            return None
+        return datetime.fromtimestamp(timestamp, self.db.MSK_TIMEZONE) \
+            .strftime('%Y-%m-%d %H:%M:%S')
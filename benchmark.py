@@ -0,0 +1,340 @@
+"""
+Замеры скорости парсинга без обращения к avito.ru.
+
+1. Сравнение способов извлечения объявлений на сохранённых страницах
+   (test_files/*.html, например avito_debug.html, который сохраняет
+   _parse_from_page_source):
+       python benchmark.py [файлы.html ...]
+2. Сквозной замер на локальном тестовом сервере (mock_avito.py):
+   AvitoParser.extract_items, ImprovedAvitoParser.main_parse_func и
+   AvitoTracker.check_all_active_searches. По каждой фазе - время,
+   количество обращений (команд WebDriver и HTTP-запросов к серверу) и
+   пиковая память за фазу (только Linux - по /proc):
+       python benchmark.py e2e [--latency 0.2] [--pages test_files]
+           [--searches 5] [--repeats 3] [--no-browser]
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from improvedParser import ImprovedAvitoParser, create_driver
+from parser import AvitoParser
+from timing import TimingPolicy
+
+
+def count_commands(driver, counter=None):
+    """Подменяет driver.execute счётчиком, возвращает словарь-счётчик
+    (можно передать общий для нескольких драйверов).
+    Через execute проходит каждая команда WebDriver (один HTTP-запрос)."""
+    if counter is None:
+        counter = {'commands': 0}
+    original_execute = driver.execute
+
+    def counting_execute(*args, **kwargs):
+        counter['commands'] += 1
+        return original_execute(*args, **kwargs)
+
+    driver.execute = counting_execute
+    return counter
+
+
+def benchmark_extraction(driver, html_path, repeats=3):
+    """Замер всех способов извлечения на одной сохранённой странице"""
+    driver.get("file://" + os.path.abspath(html_path))
+    counter = count_commands(driver)
+    results = {}
+
+    for mode in ("elements", "script", "html"):
+        parser = ImprovedAvitoParser(city="", query="", driver=driver,
+                                     extraction_mode=mode)
+        timings = []
+        for _ in range(repeats):
+            counter['commands'] = 0
+            start = time.perf_counter()
+            items = parser._parse_page()
+            timings.append(time.perf_counter() - start)
+        results[mode] = {
+            'items': items,
+            'seconds': min(timings),
+            'commands': counter['commands'],
+        }
+
+    del driver.execute  # Возврат исходного метода
+    return results
+
+
+def main(paths):
+    paths = paths or sorted(glob.glob("test_files/*.html"))
+    if not paths:
+        print("Нет сохранённых страниц (test_files/*.html)")
+        return
+
+    driver = create_driver(headless=True)
+    if not driver:
+        return
+    try:
+        for path in paths:
+            results = benchmark_extraction(driver, path)
+            print(f"\n{path}")
+            for mode, result in results.items():
+                print(f"  {mode:<9} объявлений: {len(result['items']):>3} | "
+                      f"время: {result['seconds']:.3f} с | "
+                      f"команд WebDriver: {result['commands']}")
+            reference = results['elements']['items']
+            same = all(result['items'] == reference
+                       for result in results.values())
+            print(f"  Результаты совпадают: {'Да' if same else 'Нет'}")
+    finally:
+        driver.quit()
+
+
+def rss_mb(pid="self"):
+    """Текущая память процесса (VmRSS из /proc, МБ). None, если /proc
+    недоступен или процесс уже завершился"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        return None
+    return 0.0  # Процесс-зомби: памяти уже нет
+
+
+def descendant_pids(root=None):
+    """pid всех потомков процесса root (по умолчанию этого): chromedriver,
+    Chrome и его процессы вкладок"""
+    root = root or os.getpid()
+    children = {}  # ppid -> [pid]
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", encoding="utf-8") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Имя процесса в скобках может содержать пробелы
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(name))
+    result = []
+    stack = [root]
+    while stack:
+        for pid in children.get(stack.pop(), []):
+            result.append(pid)
+            stack.append(pid)
+    return result
+
+
+class RssSampler:
+    """
+    Пиковая память за время замера: фоновый поток раз в interval секунд
+    читает VmRSS этого процесса и суммарный VmRSS его потомков (Chrome).
+    В отличие от ru_maxrss, пик считается только для своей фазы, а
+    браузеры учитываются, пока работают. Без /proc (Windows, macOS)
+    пики равны None.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.available = rss_mb() is not None
+        self.peak = None  # Этот процесс, МБ
+        self.children_peak = None  # Потомки (сумма), МБ
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = rss_mb()
+        children = sum(rss_mb(pid) or 0 for pid in descendant_pids())
+        if own is not None:
+            self.peak = max(self.peak or 0, own)
+        self.children_peak = max(self.children_peak or 0, children)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self.available:
+            self._sample()
+            self._thread = threading.Thread(target=self._run,
+                                            name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает замер (с последним замером). Возвращает пики
+        (этот процесс, потомки)"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._sample()
+        return self.peak, self.children_peak
+
+
+class PhaseRecorder:
+    """Замер фаз сквозного теста: время, обращения, пиковая память за
+    фазу (RssSampler)"""
+
+    def __init__(self, server, commands):
+        self.server = server  # MockAvitoServer (HTTP-запросы к сайту)
+        self.commands = commands  # Счётчик команд WebDriver
+        self.results = []
+
+    @contextmanager
+    def phase(self, name):
+        requests_before = self.server.request_count
+        commands_before = self.commands['commands']
+        sampler = RssSampler().start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            own, children = sampler.stop()
+            self.results.append({
+                'phase': name,
+                'seconds': seconds,
+                'http': self.server.request_count - requests_before,
+                'commands': self.commands['commands'] - commands_before,
+                'rss': own,
+                'children_rss': children,
+            })
+
+    def print_table(self):
+        print(f"\n{'Фаза':<32} {'Время, с':>9} {'HTTP':>6} {'WebDriver':>10} "
+              f"{'Память, МБ':>11} {'Дочерние, МБ':>13}")
+        for result in self.results:
+            rss = "-" if result['rss'] is None else f"{result['rss']:.0f}"
+            children = "-" if result['children_rss'] is None \
+                else f"{result['children_rss']:.0f}"
+            print(f"{result['phase']:<32} {result['seconds']:>9.3f} "
+                  f"{result['http']:>6} {result['commands']:>10} "
+                  f"{rss:>11} {children:>13}")
+
+
+def fast_timing():
+    """Политика ожиданий без случайных пауз и имитации пользователя
+    (тестовый сервер не защищается от ботов)"""
+    return TimingPolicy(min_jitter=0, max_jitter=0, idle_window=0.2,
+                        idle_timeout=5, items_timeout=10,
+                        human_behavior=False, page_delay=(0, 0))
+
+
+def run_e2e(latency=0.0, pages_dir=None, searches=5, repeats=3,
+            browser=True):
+    """Сквозной замер всех этапов на тестовом сервере"""
+    # Импорт здесь: трекер тянет за собой базу данных и уведомления
+    from database import Database
+    from driver_pool import DriverPool
+    from mock_avito import MockAvitoServer
+    from tracker import AvitoTracker
+
+    commands = {'commands': 0}
+    with MockAvitoServer(pages_dir=pages_dir, latency=latency) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        recorder = PhaseRecorder(server, commands)
+        print(f"Тестовый сервер: {server.base_url}, задержка {latency} с")
+
+        # 1. Разбор HTML без браузера
+        html = requests.get(f"{server.base_url}/moskva?q=kurtka").text
+        http_parser = AvitoParser(city="moskva", query="kurtka",
+                                  base_url=server.base_url, jitter=(0, 0))
+        for attempt in range(repeats):
+            with recorder.phase(f"extract_items #{attempt + 1}"):
+                items = http_parser.extract_items(html)
+        print(f"extract_items: {len(items)} объявлений")
+
+        # 2. Загрузка первой страницы по HTTP
+        with recorder.phase("AvitoParser.fetch_first_page"):
+            status, items = http_parser.fetch_first_page()
+        print(f"fetch_first_page: {status}, {len(items)} объявлений")
+
+        # 3. Цикл проверки трекера по HTTP (2 цикла: все объявления новые,
+        # затем 5 новых)
+        db = Database(os.path.join(tmp_dir, "benchmark_http.db"))
+        for index in range(searches):
+            db.add_search(query=f"kurtka {index}", city="moskva")
+        tracker = AvitoTracker(db, use_http=True, backoff=False,
+                               base_url=server.base_url,
+                               timing=fast_timing(), notify=False)
+        for cycle in (1, 2):
+            with recorder.phase(f"check_all (http) цикл {cycle}"):
+                tracker.check_all_active_searches()
+            server.add_new_items(5)
+        db.close()
+
+        if browser:
+            run_browser_phases(recorder, server, commands, searches,
+                               tmp_dir, Database, DriverPool, AvitoTracker)
+        recorder.print_table()
+    return recorder.results
+
+
+def run_browser_phases(recorder, server, commands, searches, tmp_dir,
+                       Database, DriverPool, AvitoTracker):
+    """Фазы с браузером (пропускаются, если Chrome недоступен)"""
+    def counting_driver(**kwargs):
+        driver = create_driver(**kwargs)
+        if driver:
+            count_commands(driver, commands)
+        return driver
+
+    with recorder.phase("create_driver"):
+        driver = counting_driver(headless=True)
+    if not driver:
+        print("Chrome недоступен - фазы с браузером пропущены")
+        return
+    try:
+        parser = ImprovedAvitoParser(city="moskva", query="kurtka",
+                                     driver=driver, timing=fast_timing(),
+                                     base_url=server.base_url)
+        with recorder.phase("ImprovedAvitoParser.main_parse"):
+            items = parser.main_parse_func(headless=True)
+        print(f"main_parse_func: {parser.last_status}, "
+              f"{len(items)} объявлений")
+    finally:
+        driver.quit()
+
+    db = Database(os.path.join(tmp_dir, "benchmark_browser.db"))
+    for index in range(searches):
+        db.add_search(query=f"kurtka {index}", city="moskva")
+    pool = DriverPool(size=1, driver_factory=counting_driver)
+    tracker = AvitoTracker(db, driver_pool=pool, backoff=False,
+                           base_url=server.base_url, timing=fast_timing(),
+                           notify=False)
+    try:
+        for cycle in (1, 2):
+            with recorder.phase(f"check_all (browser) цикл {cycle}"):
+                tracker.check_all_active_searches()
+            server.add_new_items(5)
+    finally:
+        pool.close_all()
+        db.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["e2e"]:
+        arg_parser = argparse.ArgumentParser(
+            prog="benchmark.py e2e",
+            description="Сквозной замер на тестовом сервере")
+        arg_parser.add_argument("--latency", type=float, default=0.0)
+        arg_parser.add_argument("--pages", default=None,
+                                help="папка с сохранёнными страницами")
+        arg_parser.add_argument("--searches", type=int, default=5)
+        arg_parser.add_argument("--repeats", type=int, default=3)
+        arg_parser.add_argument("--no-browser", action="store_true")
+        args = arg_parser.parse_args(sys.argv[2:])
+        run_e2e(latency=args.latency, pages_dir=args.pages,
+                searches=args.searches, repeats=args.repeats,
+                browser=not args.no_browser)
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,67 @@
+"""
+Модуль настроек программы.
+Настройки читаются из JSON-файла (по умолчанию config.json рядом с
+программой); отсутствующие параметры берутся из DEFAULTS. Файл может
+содержать только изменённые параметры, например:
+    {"db_path": "/var/lib/avito/tracker.db", "pool_size": 3,
+     "use_http": true, "status_port": 8765}
+"""
+import json
+import os
+
+DEFAULT_PATH = "config.json"
+
+DEFAULTS = {
+    # База данных
+    "db_path": "avito_tracker_test.db",
+    # Проверки
+    "check_interval": 15,  # Базовый интервал проверки (минуты)
+    "min_interval": 5,  # Границы адаптивного интервала (минуты)
+    "max_interval": 240,
+    "max_workers": 1,  # Одновременных проверок
+    "tabs_per_driver": 1,  # Запросов во вкладках одного браузера
+    "use_http": False,  # Сначала пробовать загрузку без браузера
+    "domain_interval": None,  # Секунд между запросами к сайту
+    "notify": True,  # Системные уведомления о новых объявлениях
+    "base_url": None,  # Адрес сайта (None - avito.ru; для mock_avito.py)
+    # Браузеры
+    "pool_size": 0,  # Размер пула браузеров (0 - без пула)
+    "headless": True,
+    "block_resources": False,
+    "block_css": False,
+    "sessions_dir": None,  # Папка тёплых сессий (None - без сохранения)
+    # Наблюдение
+    "recordings_dir": None,  # Запись страниц (см. session_recorder.py)
+    "metrics_path": None,  # JSON-файл метрик после каждого цикла
+    "status_host": "127.0.0.1",  # Адрес HTTP-статуса демона
+    "status_port": 8765,  # Порт HTTP-статуса (0 - не запускать)
+    # Очередь проверок (job_queue.py)
+    "queue": False,  # Демон ставит проверки в очередь для обработчиков
+    "worker_batch": 1,  # Заданий, которые обработчик берёт за раз
+    "lease_seconds": 300,  # Аренда задания (продлевается во время проверки)
+    "max_attempts": 3,  # Истечений аренды до состояния dead
+}
+
+
+def load_config(path=None, **overrides):
+    """
+    Настройки: DEFAULTS, затем файл path (если есть), затем overrides
+    (параметры со значением None не учитываются).
+    Явно указанный, но отсутствующий файл - ошибка (FileNotFoundError);
+    config.json по умолчанию может отсутствовать.
+    Возвращает словарь.
+    """
+    config = dict(DEFAULTS)
+    if path is None:
+        path = DEFAULT_PATH if os.path.exists(DEFAULT_PATH) else None
+    if path is not None:
+        with open(path, encoding="utf-8") as f:
+            loaded = json.load(f)
+        unknown = sorted(set(loaded) - set(DEFAULTS))
+        if unknown:
+            raise ValueError(f"Неизвестные параметры в {path}: "
+                             f"{', '.join(unknown)}")
+        config.update(loaded)
+    config.update({key: value for key, value in overrides.items()
+                   if value is not None})
+    return config
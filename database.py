@@ -1,4 +1,6 @@
 import sqlite3
+import threading
+import weakref
 from datetime import datetime, timezone, timedelta
 import re
 
@@ -6,14 +8,170 @@ import re
 class Database:
     # Константа часового пояса
     MSK_TIMEZONE = timezone(timedelta(hours=3))
-
-    def __init__(self, db_path="avito_tracker_test.db"):
+    # Сколько минут после создания запроса длится первоначальный парсинг
+    # (эти объявления не считаются новыми для планировщика)
+    INITIAL_PARSE_MINUTES = 10
+
+    # Настройки каждого соединения: WAL позволяет GUI читать, пока фоновая
+    # проверка пишет; synchronous=NORMAL в режиме WAL безопасен и быстрее
+    CONNECTION_PRAGMAS = [
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA foreign_keys = ON',
+        'PRAGMA cache_size = -16000',  # ~16 МБ
+        'PRAGMA mmap_size = 67108864',  # 64 МБ
+        'PRAGMA temp_store = MEMORY',
+    ]
+
+    REBUILD_COUNTERS_SQL = '''
+        UPDATE searches SET
+            total_items = (SELECT COUNT(*) FROM items
+                           WHERE items.search_id = searches.id),
+            new_items = (SELECT COUNT(*) FROM items
+                         WHERE items.search_id = searches.id
+                         AND items.is_new = 1)
+    '''
+
+    # Объявление уникально в пределах запроса: запросы с общей выдачей
+    # (см. tracker.plan_fetches) сохраняют каждый свою копию объявления
+    ITEMS_TABLE_SQL = '''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            search_id INTEGER,
+            title TEXT NOT NULL,
+            price TEXT,
+            image_url TEXT,
+            link TEXT NOT NULL,
+            normalized_link TEXT,
+            date TEXT,
+            location TEXT,
+            delivery BOOLEAN DEFAULT 0,
+            fitting BOOLEAN DEFAULT 0,
+            description TEXT,
+            found_date TIMESTAMP,
+            is_new BOOLEAN DEFAULT 1,
+            UNIQUE (search_id, normalized_link),
+            FOREIGN KEY (search_id) REFERENCES searches (id) ON DELETE
+            CASCADE
+        )
+    '''
+
+    INDEXES = [
+        # История запроса: WHERE search_id = ? ORDER BY found_date
+        '''CREATE INDEX IF NOT EXISTS idx_items_search_found
+           ON items (search_id, found_date)''',
+        # Новые объявления запроса: WHERE search_id = ? AND is_new = 1
+        '''CREATE INDEX IF NOT EXISTS idx_items_search_new
+           ON items (search_id, is_new)''',
+    ]
+
+    # Состояния задания проверки в очереди check_jobs
+    JOB_PENDING = 'pending'  # Ждёт свободного обработчика
+    JOB_RUNNING = 'running'  # Выполняется (обработчик держит аренду)
+    JOB_DONE = 'done'  # Выполнено (хранится итог последней проверки)
+    # Аренда истекала max_attempts раз подряд (проверка роняет
+    # обработчик) - задание больше не выдаётся до retry_dead_check_jobs
+    JOB_DEAD = 'dead'
+
+    # Триггеры поддерживают счётчики searches.total_items / new_items,
+    # чтобы статистика читалась одной строкой без COUNT(*) по items
+    COUNTER_TRIGGERS = [
+        '''CREATE TRIGGER IF NOT EXISTS trg_items_counters_insert
+           AFTER INSERT ON items
+           BEGIN
+               UPDATE searches
+               SET total_items = total_items + 1,
+                   new_items = new_items + (NEW.is_new = 1)
+               WHERE id = NEW.search_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_items_counters_delete
+           AFTER DELETE ON items
+           BEGIN
+               UPDATE searches
+               SET total_items = total_items - 1,
+                   new_items = new_items - (OLD.is_new = 1)
+               WHERE id = OLD.search_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_items_counters_update
+           AFTER UPDATE OF is_new, search_id ON items
+           BEGIN
+               UPDATE searches
+               SET total_items = total_items - 1,
+                   new_items = new_items - (OLD.is_new = 1)
+               WHERE id = OLD.search_id;
+               UPDATE searches
+               SET total_items = total_items + 1,
+                   new_items = new_items + (NEW.is_new = 1)
+               WHERE id = NEW.search_id;
+           END''',
+    ]
+
+    def __init__(self, db_path="avito_tracker_test.db", timeout=30):
         self.db_path = db_path
+        self.timeout = timeout  # Сколько секунд ждать снятия блокировки
+        # Постоянное соединение для каждого потока (GUI, фоновая проверка)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_database()
 
+    def _get_connection(self):
+        """Постоянное соединение текущего потока (создаётся при первом
+        обращении)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+
+        # check_same_thread=False - только чтобы close() мог закрыть
+        # соединения всех потоков; каждое соединение используется одним
+        # потоком
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                               check_same_thread=False)
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        self._local.conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+        # Потоки пула проверок, обработчиков HTTP и т.п. живут недолго -
+        # соединение закрывается вместе с потоком (иначе каждый новый
+        # поток оставлял бы открытое соединение до close())
+        weakref.finalize(threading.current_thread(), self._close_connection,
+                         conn)
+        return conn
+
+    def release_thread_connection(self):
+        """Закрывает соединение текущего потока (в конце работы потока;
+        следующее обращение откроет новое)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            self._close_connection(conn)
+
+    def _close_connection(self, conn):
+        with self._connections_lock:
+            if conn not in self._connections:
+                return  # Уже закрыто (close() или release_thread_connection)
+            self._connections.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Закрывает соединения всех потоков (при завершении программы)"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        # Следующее обращение из этого же объекта откроет новые соединения
+        self._local = threading.local()
+
     def init_database(self):
         # Инициализация базы данных и таблиц
-        conn = sqlite3.connect(self.db_path)  # Файл создается автоматически
+        conn = self._get_connection()  # Файл создается автоматически
         cursor = conn.cursor()
 
         """Таблицы searches (поисковые запросы) и items (найденные объявления)"""
@@ -33,28 +191,107 @@ class Database:
             )
         ''')
 
+        cursor.execute(self.ITEMS_TABLE_SQL.format(table='items'))
+        # Старые базы: normalized_link был уникален во всей таблице
+        links_migrated = self._migrate_items_unique_per_search(cursor)
+
+        # Миграции существующих баз (новые колонки добавляются в конец)
+        # last_tier - каким способом последний раз удалось проверить запрос
+        self._add_column_if_missing(cursor, 'searches', 'last_tier', 'TEXT')
+
+        # Индексы для выборок по запросу (история, счётчики, отметка
+        # просмотренных). Без них каждый запрос - полный просмотр items
+        # (планы запросов проверяет test_query_plans.py)
+        for statement in self.INDEXES:
+            cursor.execute(statement)
+
+        # Счётчики объявлений запроса (поддерживаются триггерами)
+        counters_added = self._add_column_if_missing(
+            cursor, 'searches', 'total_items', 'INTEGER NOT NULL DEFAULT 0')
+        counters_added |= self._add_column_if_missing(
+            cursor, 'searches', 'new_items', 'INTEGER NOT NULL DEFAULT 0')
+        for statement in self.COUNTER_TRIGGERS:
+            cursor.execute(statement)
+        if counters_added:
+            # Заполнение счётчиков для уже накопленных объявлений
+            cursor.execute(self.REBUILD_COUNTERS_SQL)
+
+        # inherit_links - первая проверка после миграции уникальности
+        # ссылок (см. add_items): объявления, которые раньше сохранялись
+        # только под другим запросом, не считаются новыми
+        self._add_column_if_missing(cursor, 'searches', 'inherit_links',
+                                    'INTEGER NOT NULL DEFAULT 0')
+        if links_migrated:
+            cursor.execute('UPDATE searches SET inherit_links = 1')
+
+        # Состояние отсрочек после капчи/блокировок (BackoffController):
+        # ключ 'search:<id>' - отсрочка запроса, 'global' - общая
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                search_id INTEGER,
-                title TEXT NOT NULL,
-                price TEXT,
-                image_url TEXT,
-                link TEXT NOT NULL,   
-                normalized_link TEXT UNIQUE,  
-                date TEXT,
-                location TEXT,
-                delivery BOOLEAN DEFAULT 0,
-                fitting BOOLEAN DEFAULT 0,
-                description TEXT,
-                found_date TIMESTAMP,
-                is_new BOOLEAN DEFAULT 1,
-                FOREIGN KEY (search_id) REFERENCES searches (id) ON DELETE 
+            CREATE TABLE IF NOT EXISTS backoff_state (
+                key TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL DEFAULT 0,
+                blocked_until TIMESTAMP,
+                last_status TEXT,
+                updated TIMESTAMP
+            )
+        ''')
+
+        # Очередь заданий проверки для обработчиков в других процессах
+        # (job_queue.py): одно задание на запрос, аренда lease_until
+        # продлевается обработчиком; истёкшая аренда возвращает задание
+        # в очередь
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS check_jobs (
+                search_id INTEGER PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                due_at TIMESTAMP NOT NULL,
+                worker TEXT,
+                lease_until TIMESTAMP,
+                heartbeat TIMESTAMP,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_status TEXT,
+                last_error TEXT,
+                updated TIMESTAMP,
+                FOREIGN KEY (search_id) REFERENCES searches (id) ON DELETE
                 CASCADE
             )
         ''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_check_jobs_state_due
+                          ON check_jobs (state, due_at)''')
+
         conn.commit()
-        conn.close()
+
+    def _migrate_items_unique_per_search(self, cursor):
+        """Пересоздаёт items с уникальностью (search_id, normalized_link)
+        вместо глобально уникального normalized_link (SQLite не умеет
+        удалять ограничение UNIQUE). Индексы и триггеры создаются заново
+        в init_database. Возвращает True, если таблица пересоздана"""
+        cursor.execute('PRAGMA index_list(items)')
+        for _seq, name, unique, *_rest in cursor.fetchall():
+            if not unique:
+                continue
+            cursor.execute(f'PRAGMA index_info("{name}")')
+            columns = [row[2] for row in cursor.fetchall()]
+            if columns == ['normalized_link']:
+                break
+        else:
+            return False
+        print("Миграция items: уникальность ссылки в пределах запроса")
+        cursor.execute(self.ITEMS_TABLE_SQL.format(table='items_migrated'))
+        cursor.execute('INSERT INTO items_migrated SELECT * FROM items')
+        cursor.execute('DROP TABLE items')
+        cursor.execute('ALTER TABLE items_migrated RENAME TO items')
+        return True
+
+    def _add_column_if_missing(self, cursor, table, column, definition):
+        """Добавляет колонку в таблицу, если её ещё нет.
+        Возвращает True, если колонка была добавлена"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        columns = [row[1] for row in cursor.fetchall()]
+        if column in columns:
+            return False
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
 
     def _normalize_avito_url(self, url):
         """
@@ -89,29 +326,27 @@ class Database:
                 first_query_words[:-3] + '...'
 
         # Добавление нового поискового запроса
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        conn = self._get_connection()
 
         # Создаем метку времени
         current_time = self._get_current_time_msk()
 
-        # Вставка данных в таблицу searches
-        cursor.execute('''
-            INSERT INTO searches 
-            (name, query, city, price_min, price_max, delivery, fitting, 
-            created_date, last_check)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (name, query, city, price_min, price_max, delivery, fitting,
-              current_time, current_time))
+        # Вставка данных в таблицу searches (with - коммит или откат)
+        with conn:
+            cursor = conn.execute('''
+                INSERT INTO searches 
+                (name, query, city, price_min, price_max, delivery, fitting, 
+                created_date, last_check)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (name, query, city, price_min, price_max, delivery, fitting,
+                  current_time, current_time))
 
         search_id = cursor.lastrowid  # Получение id только что добав. запроса
-        conn.commit()
-        conn.close()
         return search_id
 
     def get_active_searches(self):
         """Получение всех активных поисковых запросов"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -119,14 +354,13 @@ class Database:
         ''')
 
         searches = cursor.fetchall()
-        conn.close()
 
         return searches
 
     def add_item(self, item, search_id):
         """Добавление найденного объявления (нового)
         Возвращает id, если объявление новое, иначе None"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
         current_time = self._get_current_time_msk()
 
@@ -157,57 +391,151 @@ class Database:
         except sqlite3.IntegrityError as e:
             # Этот блок сработает, если будет конфликт по normalized_link
             print(f"Объявление уже существует: {normalized_link}")
+            conn.rollback()
             return None
-        finally:
-            conn.close()
+
+    def add_items(self, items, search_id):
+        """
+        Пакетное добавление объявлений одной транзакцией.
+        Возвращает список новых объявлений (уже известные и повторы внутри
+        пакета пропускаются).
+        На первой проверке запроса после миграции уникальности ссылок
+        (searches.inherit_links) объявления, уже сохранённые другими
+        запросами, добавляются просмотренными и в результат не попадают -
+        раньше запрос получал их только через другой запрос.
+        """
+        current_time = self._get_current_time_msk()
+
+        # Нормализация ссылок и удаление повторов внутри пакета
+        batch = {}
+        for item in items:
+            normalized_link = self._normalize_avito_url(item['link'])
+            batch.setdefault(normalized_link, item)
+        if not batch:
+            return []
+
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            # Блокировка на запись сразу: между проверкой и вставкой
+            # другой поток не добавит те же объявления
+            cursor.execute('BEGIN IMMEDIATE')
+            existing = set()
+            links = list(batch)
+            for start in range(0, len(links), 500):
+                chunk = links[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT normalized_link FROM items
+                    WHERE search_id = ? AND normalized_link IN ({placeholders})
+                ''', [search_id] + chunk)
+                existing.update(row[0] for row in cursor.fetchall())
+
+            new_items = [(normalized_link, item)
+                         for normalized_link, item in batch.items()
+                         if normalized_link not in existing]
+            inherited = self._inherited_links(cursor, search_id,
+                                              [link for link, _ in new_items])
+            cursor.executemany('''
+                INSERT OR IGNORE INTO items 
+                (search_id, title, price, image_url, link, normalized_link, 
+                date, location, delivery, fitting, description, found_date,
+                is_new)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(search_id,
+                   item['title'],
+                   item['price'],
+                   item['image_url'],
+                   item['link'],
+                   normalized_link,
+                   item['date'],
+                   item['location'],
+                   item['delivery'],
+                   item['fitting'],
+                   item['description'],
+                   current_time,
+                   0 if normalized_link in inherited else 1)
+                  for normalized_link, item in new_items])
+            conn.commit()
+            return [item for normalized_link, item in new_items
+                    if normalized_link not in inherited]
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _inherited_links(self, cursor, search_id, links):
+        """Для первой проверки после миграции (inherit_links): ссылки из
+        links, сохранённые под другими запросами. Флаг сбрасывается (в
+        транзакции add_items)"""
+        cursor.execute('SELECT inherit_links FROM searches WHERE id = ?',
+                       (search_id,))
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            return set()
+        cursor.execute('UPDATE searches SET inherit_links = 0 WHERE id = ?',
+                       (search_id,))
+        # Один раз на запрос: поиск по ссылке без индекса допустим
+        inherited = set()
+        for start in range(0, len(links), 500):
+            chunk = links[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT normalized_link FROM items
+                WHERE search_id != ? AND normalized_link IN ({placeholders})
+            ''', [search_id] + chunk)
+            inherited.update(row[0] for row in cursor.fetchall())
+        return inherited
 
     def process_items(self, items, search_id):
         """
         Обрабатывает список объявлений: сохраняет только новые
         Возвращает список новых объявлений
         """
-        new_items_list = []
-
-        for item in items:
-            if self.add_item(item, search_id):
-                new_items_list.append(item)
-
-        return new_items_list
-
-    # def item_exists(self, link):
-    #     """Проверка существования объявления с данной ссылкой в бд"""
-    #     conn = sqlite3.connect(self.db_path)
-    #     cursor = conn.cursor()
-    #
-    #     cursor.execute('SELECT id FROM items WHERE link = ?', (link,))
-    #     exists = cursor.fetchone() is not None
-    #
-    #     conn.close()
-    #     return exists
+        return self.add_items(items, search_id)
+
+    def filter_known_links(self, links, search_id):
+        """Возвращает множество ссылок из links, которые уже сохранены для
+        запроса search_id (сравнение по нормализованной ссылке)"""
+        normalized = {}
+        for link in links:
+            normalized.setdefault(self._normalize_avito_url(link), []).append(
+                link)
+        if not normalized:
+            return set()
+
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' * len(normalized))
+        cursor.execute(f'''
+            SELECT normalized_link FROM items
+            WHERE search_id = ? AND normalized_link IN ({placeholders})
+        ''', [search_id] + list(normalized))
+        known = set()
+        for (normalized_link,) in cursor.fetchall():
+            known.update(normalized[normalized_link])
+        return known
 
     def get_search_by_id(self, search_id):
         """Получение запроса по id в виде кортежа"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
 
         cursor.execute('SELECT * FROM searches WHERE id = ?', (search_id,))
         search = cursor.fetchone()
 
-        conn.close()
         return search
 
     def get_item_by_id(self, item_id):
         """Получение объявления по id в виде кортежа"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM items WHERE id = ?', (item_id,))
         item = cursor.fetchone()
-        conn.close()
         return item
 
     def get_active_searches(self):
         """Получает список всех активных поисковых запросов."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT s.*, COUNT(i.id) as items_count
@@ -217,12 +545,45 @@ class Database:
             ORDER BY s.last_check DESC
         ''')
         searches = cursor.fetchall()
-        conn.close()
         return searches
 
+    def get_dashboard_rows(self):
+        """
+        Данные для главного окна одним запросом: по каждому запросу
+        (id, name, city, всего объявлений, новых объявлений, last_check).
+        """
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, name, city, total_items, new_items, last_check
+            FROM searches
+            ORDER BY last_check DESC
+        ''')
+        return cursor.fetchall()
+
+    def get_search_activity(self, since):
+        """
+        Активность запросов для планировщика: по каждому активному запросу
+        (id, created_date, last_check, кол-во объявлений, найденных после
+        since). Объявления первоначального парсинга (в первые
+        INITIAL_PARSE_MINUTES после создания запроса) не учитываются.
+        since - строка времени MSK ('%Y-%m-%d %H:%M:%S').
+        """
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.id, s.created_date, s.last_check,
+                   (SELECT COUNT(*) FROM items i
+                    WHERE i.search_id = s.id
+                    AND i.found_date >= MAX(?, datetime(s.created_date, ?)))
+            FROM searches s
+            WHERE s.is_active = 1
+        ''', (since, f'+{self.INITIAL_PARSE_MINUTES} minutes'))
+        return cursor.fetchall()
+
     def get_items_by_search_id(self, search_id):
         """Получает все объявления для указанного поискового запроса."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT * FROM items 
@@ -230,101 +591,311 @@ class Database:
             ORDER BY found_date DESC
         ''', (search_id,))
         items = cursor.fetchall()
-        conn.close()
         return items
 
-    def mark_items_as_viewed(self, search_id):
-        """Помечает все объявления в поисковом запросе как просмотренные."""
-        conn = sqlite3.connect(self.db_path)
+    def get_items_page(self, search_id, limit=100, after=None):
+        """
+        Страница объявлений запроса (от новых к старым) без описания.
+        after - курсор (found_date, id) последней строки предыдущей
+        страницы. Возвращает кортежи
+        (id, title, price, link, date, delivery, fitting, is_new, found_date).
+        """
+        conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE items 
-            SET is_new = 0 
-            WHERE search_id = ? AND is_new = 1
-        ''', (search_id,))
-        conn.commit()
-        conn.close()
+        columns = '''id, title, price, link, date, delivery, fitting, is_new,
+                     found_date'''
+        if after is None:
+            cursor.execute(f'''
+                SELECT {columns} FROM items
+                WHERE search_id = ?
+                ORDER BY found_date DESC, id DESC
+                LIMIT ?
+            ''', (search_id, limit))
+        else:
+            # Keyset-пагинация: продолжение сразу после курсора по индексу
+            cursor.execute(f'''
+                SELECT {columns} FROM items
+                WHERE search_id = ? AND (found_date, id) < (?, ?)
+                ORDER BY found_date DESC, id DESC
+                LIMIT ?
+            ''', (search_id, after[0], after[1], limit))
+        return cursor.fetchall()
+
+    def mark_items_as_viewed(self, search_id, item_ids=None):
+        """Помечает объявления в поисковом запросе как просмотренные
+        (все или только item_ids)."""
+        conn = self._get_connection()
+        with conn:
+            if item_ids is None:
+                conn.execute('''
+                    UPDATE items 
+                    SET is_new = 0 
+                    WHERE search_id = ? AND is_new = 1
+                ''', (search_id,))
+            else:
+                conn.executemany('''
+                    UPDATE items 
+                    SET is_new = 0 
+                    WHERE id = ? AND search_id = ? AND is_new = 1
+                ''', [(item_id, search_id) for item_id in item_ids])
 
     def delete_item(self, item_id):
         """Удаляет объявление по его ID."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM items WHERE id = ?', (item_id,))
-        conn.commit()
-        conn.close()
+        conn = self._get_connection()
+        with conn:
+            conn.execute('DELETE FROM items WHERE id = ?', (item_id,))
 
     def delete_search(self, search_id):
         """Удаляет запрос по его ID."""
-        conn = sqlite3.connect(self.db_path)
+        # Поддержка внешних ключей включена для всех соединений
+        # (CONNECTION_PRAGMAS), объявления удаляются каскадно
+        conn = self._get_connection()
+        with conn:
+            conn.execute('DELETE FROM searches WHERE id = ?', (search_id,))
+            conn.execute('DELETE FROM backoff_state WHERE key = ?',
+                         (f'search:{search_id}',))
+
+    def get_backoff_state(self, key):
+        """Отсрочка по ключу: (failures, blocked_until, last_status) или
+        None"""
+        conn = self._get_connection()
         cursor = conn.cursor()
+        cursor.execute('''
+            SELECT failures, blocked_until, last_status
+            FROM backoff_state
+            WHERE key = ?
+        ''', (key,))
+        return cursor.fetchone()
 
-        # ВКЛЮЧАЕМ поддержку внешних ключей
-        cursor.execute("PRAGMA foreign_keys = ON")
-
-        cursor.execute('DELETE FROM searches WHERE id = ?', (search_id,))
-        conn.commit()
-        conn.close()
-
+    def update_backoff_states(self, keys, update):
+        """
+        Атомарное изменение отсрочек по ключам keys: чтение и запись в
+        одной транзакции BEGIN IMMEDIATE, поэтому обработчики в разных
+        процессах не перезаписывают изменения друг друга.
+        update(key, failures, blocked_until, last_status) возвращает новые
+        (failures, blocked_until, last_status) или None (без изменений);
+        для отсутствующего ключа вызывается с (0, None, None).
+        """
+        now = self._get_current_time_msk()
+        conn = self._get_connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for key in keys:
+                row = conn.execute('''
+                    SELECT failures, blocked_until, last_status
+                    FROM backoff_state WHERE key = ?
+                ''', (key,)).fetchone()
+                new = update(key, *(row or (0, None, None)))
+                if new is None:
+                    continue
+                conn.execute('''
+                    INSERT INTO backoff_state
+                    (key, failures, blocked_until, last_status, updated)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        failures = excluded.failures,
+                        blocked_until = excluded.blocked_until,
+                        last_status = excluded.last_status,
+                        updated = excluded.updated
+                ''', (key, *new, now))
+
+    def enqueue_check_jobs(self, search_ids, due_at=None):
+        """
+        Ставит запросы в очередь проверки (due_at - строка времени MSK,
+        по умолчанию сейчас). Задания, которые уже ждут или выполняются,
+        не меняются - повторная постановка не создаёт дублей.
+        """
+        due_at = due_at or self._get_current_time_msk()
+        now = self._get_current_time_msk()
+        conn = self._get_connection()
+        with conn:
+            conn.executemany('''
+                INSERT INTO check_jobs (search_id, state, due_at, updated)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(search_id) DO UPDATE SET
+                    state = excluded.state,
+                    due_at = excluded.due_at,
+                    attempts = 0,
+                    updated = excluded.updated
+                WHERE check_jobs.state = ?
+            ''', [(search_id, self.JOB_PENDING, due_at, now, self.JOB_DONE)
+                  for search_id in search_ids])
+
+    def claim_check_jobs(self, worker, limit=1, lease_seconds=300,
+                         max_attempts=3):
+        """
+        Атомарно берёт до limit заданий, чья очередь подошла, в том числе
+        задания с истёкшей арендой (обработчик завершился аварийно).
+        Задания с истёкшей арендой, взятые уже max_attempts раз,
+        переводятся в JOB_DEAD (None - без ограничения).
+        Возвращает список search_id.
+        """
+        now = datetime.now(self.MSK_TIMEZONE)
+        now_text = now.strftime('%Y-%m-%d %H:%M:%S')
+        lease_until = (now + timedelta(seconds=lease_seconds)) \
+            .strftime('%Y-%m-%d %H:%M:%S')
+        conn = self._get_connection()
+        with conn:
+            # BEGIN IMMEDIATE сразу берёт блокировку записи: выбор и
+            # аренду заданий не может "перехватить" другой процесс
+            conn.execute('BEGIN IMMEDIATE')
+            if max_attempts:
+                conn.execute('''
+                    UPDATE check_jobs
+                    SET state = ?, worker = NULL, lease_until = NULL,
+                        last_status = 'error',
+                        last_error = 'аренда истекла, попыток: ' || attempts,
+                        updated = ?
+                    WHERE state = ? AND lease_until < ? AND attempts >= ?
+                ''', (self.JOB_DEAD, now_text, self.JOB_RUNNING, now_text,
+                      max_attempts))
+            cursor = conn.execute('''
+                SELECT search_id FROM check_jobs
+                WHERE (state = ? AND due_at <= ?)
+                   OR (state = ? AND lease_until < ?)
+                ORDER BY due_at
+                LIMIT ?
+            ''', (self.JOB_PENDING, now_text, self.JOB_RUNNING, now_text,
+                  limit))
+            search_ids = [row[0] for row in cursor.fetchall()]
+            conn.executemany('''
+                UPDATE check_jobs
+                SET state = ?, worker = ?, lease_until = ?, heartbeat = ?,
+                    attempts = attempts + 1, updated = ?
+                WHERE search_id = ?
+            ''', [(self.JOB_RUNNING, worker, lease_until, now_text, now_text,
+                   search_id) for search_id in search_ids])
+        return search_ids
+
+    def extend_check_leases(self, worker, search_ids, lease_seconds=300):
+        """Продлевает аренду заданий обработчика. Возвращает search_id,
+        аренда которых ещё принадлежит обработчику"""
+        now = datetime.now(self.MSK_TIMEZONE)
+        now_text = now.strftime('%Y-%m-%d %H:%M:%S')
+        lease_until = (now + timedelta(seconds=lease_seconds)) \
+            .strftime('%Y-%m-%d %H:%M:%S')
+        held = []
+        conn = self._get_connection()
+        with conn:
+            for search_id in search_ids:
+                cursor = conn.execute('''
+                    UPDATE check_jobs
+                    SET lease_until = ?, heartbeat = ?
+                    WHERE search_id = ? AND worker = ? AND state = ?
+                ''', (lease_until, now_text, search_id, worker,
+                      self.JOB_RUNNING))
+                if cursor.rowcount:
+                    held.append(search_id)
+        return held
+
+    def finish_check_job(self, worker, search_id, status, error=None):
+        """Отмечает задание выполненным. Возвращает False, если аренда
+        уже перешла к другому обработчику"""
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute('''
+                UPDATE check_jobs
+                SET state = ?, worker = NULL, lease_until = NULL,
+                    last_status = ?, last_error = ?, updated = ?
+                WHERE search_id = ? AND worker = ? AND state = ?
+            ''', (self.JOB_DONE, status, error, self._get_current_time_msk(),
+                  search_id, worker, self.JOB_RUNNING))
+        return cursor.rowcount > 0
+
+    def release_check_jobs(self, worker):
+        """Возвращает в очередь невыполненные задания обработчика (при
+        его остановке; такая аренда не считается попыткой)"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute('''
+                UPDATE check_jobs
+                SET state = ?, worker = NULL, lease_until = NULL,
+                    attempts = MAX(attempts - 1, 0), updated = ?
+                WHERE worker = ? AND state = ?
+            ''', (self.JOB_PENDING, self._get_current_time_msk(), worker,
+                  self.JOB_RUNNING))
+
+    def retry_dead_check_jobs(self, search_ids=None):
+        """Возвращает в очередь задания JOB_DEAD (все или search_ids).
+        Возвращает количество заданий"""
+        params = [self.JOB_PENDING, self._get_current_time_msk(),
+                  self._get_current_time_msk(), self.JOB_DEAD]
+        where = ''
+        if search_ids is not None:
+            search_ids = list(search_ids)
+            if not search_ids:
+                return 0
+            where = f" AND search_id IN ({','.join('?' * len(search_ids))})"
+            params.extend(search_ids)
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(f'''
+                UPDATE check_jobs
+                SET state = ?, due_at = ?, attempts = 0, updated = ?
+                WHERE state = ?{where}
+            ''', params)
+        return cursor.rowcount
+
+    def get_check_jobs(self):
+        """Задания очереди: список (search_id, state, due_at, worker,
+        lease_until, attempts, last_status, last_error)"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT search_id, state, due_at, worker, lease_until, attempts,
+                   last_status, last_error
+            FROM check_jobs
+            ORDER BY due_at
+        ''')
+        return cursor.fetchall()
 
     def get_new_items_count(self, search_id):
         """Возвращает количество непросмотренных объявлений для запроса"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) FROM items 
-            WHERE search_id = ? AND is_new = 1
-        ''', (search_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        cursor.execute('SELECT new_items FROM searches WHERE id = ?',
+                       (search_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
 
 
     def get_total_count(self, search_id):
         """Возвращает количество всех объявлений для запроса"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) FROM items 
-            WHERE search_id = ?
-        ''', (search_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        cursor.execute('SELECT total_items FROM searches WHERE id = ?',
+                       (search_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
 
-    def update_last_check(self, search_id):
+    def update_last_check(self, search_id, tier=None):
         """Время последней проверки (устанавливается текущее) конкретного
         запроса
-        (по id)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        (по id). tier - способ получения данных ("http"/"browser")"""
+        conn = self._get_connection()
 
         # Создаем метку времени с учетом часового пояса MSK (UTC+3)
         current_time = self._get_current_time_msk()
-        cursor.execute('''
-            UPDATE searches
-            SET last_check = ?
-            WHERE id = ?
-        ''', (current_time, search_id))
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute('''
+                UPDATE searches
+                SET last_check = ?, last_tier = COALESCE(?, last_tier)
+                WHERE id = ?
+            ''', (current_time, tier, search_id))
 
     def toggle_search_active(self, search_id, is_active):
         """Активация/деактивация запроса"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            UPDATE searches 
-            SET is_active = ?
-            WHERE id = ?
-        ''', (is_active, search_id))
-
-        conn.commit()
-        conn.close()
+        conn = self._get_connection()
+        with conn:
+            conn.execute('''
+                UPDATE searches 
+                SET is_active = ?
+                WHERE id = ?
+            ''', (is_active, search_id))
 
     def get_search_history(self, search_id, limit=30):
         """Просмотр истории объявлений по конкретному запросу"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._get_connection()
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -336,7 +907,6 @@ class Database:
             LIMIT ?
         ''', (search_id, limit))
         items = cursor.fetchall()
-        conn.close()
 
         # Преобразование в список словарей
         history = []
@@ -360,50 +930,78 @@ class Database:
         - кол-во новых объялений
         - дата последней проверки
         """
-        # Общее количество объявлений
-        conn = sqlite3.connect(self.db_path)
+        # Счётчики поддерживаются триггерами - одна строка из searches
+        conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM items WHERE search_id = ?',
-                       (search_id,))
-        total_count = cursor.fetchone()[0]
-
-        # Количество новых объявлений
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM items WHERE search_id = ? '
-                       'AND is_new = 1',
-                       (search_id,))
-        new_count = cursor.fetchone()[0]
-
-        # Дата последней проверки
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT last_check FROM searches WHERE id = ? ',
-                       (search_id,))
-        last_check = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT total_items, new_items, last_check
+            FROM searches WHERE id = ?
+        ''', (search_id,))
+        total_count, new_count, last_check = cursor.fetchone()
 
-        conn.close()
         return {
             'total_items': total_count,
             'new_items': new_count,
             'last_check': last_check
         }
 
-    def mark_item_as_viewed(self, item_id):
-        """Помечает объявление как просмотренное (не новое)"""
-        conn = sqlite3.connect(self.db_path)
+    def check_counters(self, repair=False):
+        """
+        Сверка счётчиков total_items/new_items с фактическим количеством
+        объявлений. Возвращает список расхождений
+        (search_id, total_items, факт. всего, new_items, факт. новых).
+        repair=True - пересчитать счётчики заново.
+        """
+        conn = self._get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            UPDATE items
-            SET is_new = 0
-            WHERE id = ?
-            ''', (item_id,))
-        conn.commit()
-        conn.close()
+            SELECT s.id, s.total_items, COUNT(i.id),
+                   s.new_items, COALESCE(SUM(i.is_new = 1), 0)
+            FROM searches s
+            LEFT JOIN items i ON s.id = i.search_id
+            GROUP BY s.id
+            HAVING s.total_items != COUNT(i.id)
+                OR s.new_items != COALESCE(SUM(i.is_new = 1), 0)
+        ''')
+        mismatches = cursor.fetchall()
+        if repair:
+            self.rebuild_counters()
+        return mismatches
+
+    def rebuild_counters(self):
+        """Пересчёт счётчиков объявлений всех запросов"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute(self.REBUILD_COUNTERS_SQL)
+
+    def mark_item_as_viewed(self, item_id):
+        """Помечает объявление как просмотренное (не новое)"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute('''
+                UPDATE items
+                SET is_new = 0
+                WHERE id = ?
+                ''', (item_id,))
 
 
 # Тестирование
 if __name__ == "__main__":
+    import sys
+
+    # Обслуживание: python database.py --check-counters [путь к бд]
+    #               python database.py --rebuild-counters [путь к бд]
+    if len(sys.argv) > 1 and sys.argv[1] in ('--check-counters',
+                                             '--rebuild-counters'):
+        db = Database(*sys.argv[2:3])
+        repair = sys.argv[1] == '--rebuild-counters'
+        for mismatch in db.check_counters(repair=repair):
+            print("Запрос {}: всего {} (факт. {}), новых {} (факт. {})"
+                  .format(*mismatch))
+        print("Счётчики пересчитаны" if repair else "Проверка завершена")
+        db.close()
+        sys.exit()
+
     db = Database()
 
     # Тест добавления поискового запроса
@@ -420,3 +1018,5 @@ if __name__ == "__main__":
     # Тест получения активных запросов
     searches = db.get_active_searches()
     print(f"Активные запросы: {searches}")
+
+    db.close()
@@ -0,0 +1,115 @@
+"""
+Модуль фонового доступа к базе данных для GUI.
+Все обращения к SQLite выполняются в отдельном потоке, а результаты
+возвращаются в главный поток Tkinter через root.after. Поэтому окно не
+"зависает", пока проверка держит блокировку записи в базе.
+"""
+import queue
+import threading
+
+
+class DbWorker:
+    """
+    Поток с очередью запросов к Database.
+    Args:
+        db: Экземпляр Database (поток воркера открывает своё соединение).
+        root: Окно Tkinter, в потоке которого вызываются колбэки.
+        on_busy: Функция on_busy(True/False) - есть ли незавершённые
+            запросы (для индикатора загрузки).
+        poll_ms: Период проверки готовых результатов (мс).
+    """
+
+    _STOP = object()  # Сигнал завершения потока
+
+    def __init__(self, db, root, on_busy=None, poll_ms=50):
+        self.db = db
+        self.root = root
+        self.on_busy = on_busy
+        self.poll_ms = poll_ms
+
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._pending = 0  # Изменяется только в потоке Tkinter
+        self._poll_id = None
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="db-worker",
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        """Есть ли запросы, результат которых ещё не получен"""
+        return self._pending > 0
+
+    def call(self, method, *args, on_done=None, on_error=None, **kwargs):
+        """
+        Ставит в очередь вызов db.<method>(*args, **kwargs).
+        Вызывать только из потока Tkinter. Запросы выполняются строго по
+        очереди, поэтому чтение после записи видит её результат.
+        Args:
+            on_done: Функция on_done(result), вызывается в потоке Tkinter.
+            on_error: Функция on_error(exception), вызывается в потоке
+                Tkinter (по умолчанию ошибка печатается).
+        """
+        if self._closed:
+            return
+        self._requests.put((method, args, kwargs, on_done, on_error))
+        self._pending += 1
+        if self._pending == 1 and self.on_busy:
+            self.on_busy(True)
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def close(self, timeout=5):
+        """Останавливает поток после выполнения уже поставленных запросов"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._poll_id is not None:
+            try:
+                self.root.after_cancel(self._poll_id)
+            except Exception:
+                pass  # Окно уже уничтожено
+            self._poll_id = None
+        self._requests.put(self._STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        """Цикл потока воркера: выполняет запросы по очереди"""
+        while True:
+            request = self._requests.get()
+            if request is self._STOP:
+                break
+            method, args, kwargs, on_done, on_error = request
+            try:
+                result = getattr(self.db, method)(*args, **kwargs)
+                self._results.put((on_done, result, None, on_error, method))
+            except Exception as e:
+                self._results.put((on_done, None, e, on_error, method))
+
+    def _poll(self):
+        """Доставка готовых результатов в потоке Tkinter"""
+        self._poll_id = None
+        while True:
+            try:
+                on_done, result, error, on_error, method = \
+                    self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            try:
+                if error is None:
+                    if on_done:
+                        on_done(result)
+                elif on_error:
+                    on_error(error)
+                else:
+                    print(f"Ошибка базы данных ({method}): {error}")
+            except Exception as e:
+                print(f"Ошибка обработки результата ({method}): {e}")
+
+        if self._pending == 0 and self.on_busy:
+            self.on_busy(False)
+        if self._pending > 0 and not self._closed and self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
@@ -0,0 +1,166 @@
+"""
+Модуль пула браузеров для ImprovedAvitoParser.
+Держит несколько "тёплых" экземпляров Chrome, чтобы каждая проверка
+не тратила время на запуск браузера и внедрение CDP-скриптов.
+"""
+import threading
+import time
+
+from improvedParser import create_driver
+
+
+class _PooledDriver:
+    """Служебная запись пула: драйвер и счётчики его использования."""
+
+    def __init__(self, driver, slot):
+        self.driver = driver
+        self.slot = slot
+        self.created_at = time.monotonic()
+        self.pages = 0  # Сколько страниц загружено этим драйвером
+
+
+class DriverPool:
+    """
+    Пул драйверов с арендой, проверкой "здоровья" и пересозданием.
+    Args:
+        size: Максимальное количество одновременно открытых браузеров.
+        max_pages: После скольких загруженных страниц драйвер пересоздаётся.
+        max_age_minutes: Через сколько минут жизни драйвер пересоздаётся.
+        headless: Запуск браузеров без графического интерфейса.
+        block_resources: Не загружать картинки, медиа, шрифты и аналитику.
+        block_css: Дополнительно не загружать стили.
+        driver_factory: Функция создания драйвера (по умолчанию create_driver).
+    """
+
+    def __init__(self, size=2, max_pages=30, max_age_minutes=30,
+                 headless=True, block_resources=False, block_css=False,
+                 driver_factory=None):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_age = max_age_minutes * 60
+        self.headless = headless
+        self.block_resources = block_resources
+        self.block_css = block_css
+        self.driver_factory = driver_factory or create_driver
+
+        self._idle = []  # Свободные драйверы
+        self._leased = {}  # id(driver) -> _PooledDriver
+        self._free_slots = list(range(size))
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """
+        Берёт драйвер из пула (при необходимости создаёт новый).
+        Блокируется, если все драйверы заняты. Возвращает driver/None.
+        """
+        with self._condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                if self._closed:
+                    return None
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._free_slots:
+                    entry = None
+                    slot = self._free_slots.pop(0)
+                    break
+                remaining = None if deadline is None else \
+                    deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    print("Пул драйверов: таймаут ожидания свободного драйвера")
+                    return None
+                self._condition.wait(remaining)
+
+        # Проверка и создание выполняются вне блокировки (это долго)
+        if entry is not None:
+            if self._is_expired(entry) or not self._is_healthy(entry.driver):
+                slot = entry.slot
+                self._quit(entry.driver)
+                entry = None
+
+        if entry is None:
+            driver = self.driver_factory(headless=self.headless,
+                                         block_resources=self.block_resources,
+                                         block_css=self.block_css)
+            if not driver:
+                self._return_slot(slot)
+                return None
+            entry = _PooledDriver(driver, slot)
+
+        with self._condition:
+            closed = self._closed
+            if not closed:
+                self._leased[id(entry.driver)] = entry
+        if closed:
+            # Пул закрыт, пока создавался драйвер
+            self._quit(entry.driver)
+            return None
+        return entry.driver
+
+    def release(self, driver, pages=1, broken=False):
+        """
+        Возвращает драйвер в пул.
+        Args:
+            pages: Сколько страниц было загружено за время аренды.
+            broken: Драйвер в неизвестном состоянии и должен быть закрыт.
+        """
+        with self._condition:
+            entry = self._leased.pop(id(driver), None)
+        if entry is None:
+            return
+
+        entry.pages += pages
+        if broken or self._closed or self._is_expired(entry):
+            self._quit(entry.driver)
+            self._return_slot(entry.slot)
+            return
+
+        with self._condition:
+            self._idle.append(entry)
+            self._condition.notify()
+
+    def key_of(self, driver):
+        """Стабильный ключ слота драйвера (для хранения сессий и т.п.)"""
+        with self._condition:
+            entry = self._leased.get(id(driver))
+        return f"driver-{entry.slot}" if entry else None
+
+    def close_all(self):
+        """Закрывает все драйверы, включая арендованные, и запрещает новые
+        аренды. Проверка, которая ещё использует драйвер, завершится
+        ошибкой; последующий release такого драйвера ничего не делает."""
+        with self._condition:
+            self._closed = True
+            entries, self._idle = self._idle, []
+            entries.extend(self._leased.values())
+            self._leased = {}
+            self._condition.notify_all()
+        for entry in entries:
+            self._quit(entry.driver)
+
+    def _is_expired(self, entry):
+        if self.max_pages and entry.pages >= self.max_pages:
+            return True
+        if self.max_age and time.monotonic() - entry.created_at >= self.max_age:
+            return True
+        return False
+
+    def _is_healthy(self, driver):
+        # Браузер может "умереть" между арендами (падение вкладки и т.п.)
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _return_slot(self, slot):
+        with self._condition:
+            self._free_slots.append(slot)
+            self._condition.notify()
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass  # Игнорируем любые ошибки при закрытии
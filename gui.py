@@ -1,13 +1,16 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 
+from db_worker import DbWorker
+import metrics
+
 
 class AddSearchDialog(tk.Toplevel):
     """Диалоговое окно для добавления нового поискового запроса."""
 
-    def __init__(self, parent, db, on_success_callback):
+    def __init__(self, parent, db_worker, on_success_callback):
         super().__init__(parent)
-        self.db = db
+        self.db_worker = db_worker
         self.on_success = on_success_callback
         self.title("Добавить новый запрос")
         self.geometry("400x350")
@@ -66,8 +69,9 @@ class AddSearchDialog(tk.Toplevel):
         button_frame.grid(row=4, column=0, columnspan=2, pady=(20, 0))
         ttk.Button(button_frame, text="Отмена", command=self.destroy).pack(
             side=tk.RIGHT, padx=5)
-        ttk.Button(button_frame, text="Сохранить",
-                   command=self._save_search).pack(side=tk.RIGHT)
+        self.save_button = ttk.Button(button_frame, text="Сохранить",
+                                      command=self._save_search)
+        self.save_button.pack(side=tk.RIGHT)
 
         self.grab_set()  # Модальное окно
 
@@ -89,22 +93,29 @@ class AddSearchDialog(tk.Toplevel):
 
         delivery = self.delivery_var.get()
 
-        # Сохранение в базу данных
-        try:
-            search_id = self.db.add_search(
-                query=query,
-                city=city,
-                price_min=price_min,
-                price_max=price_max,
-                delivery=delivery
-            )
-            messagebox.showinfo("Выполнено!",
-                                f"Поисковый запрос добавлен (ID: {search_id})")
-            self.on_success()  # Обновляем список в главном окне
-            self.destroy()
-        except Exception as e:
-            messagebox.showerror("Ошибка базы данных",
-                                 f"Не удалось сохранить запрос: {e}")
+        # Сохранение в базу данных (в фоновом потоке)
+        self.save_button.config(state=tk.DISABLED, text="Сохранение...")
+        self.db_worker.call(
+            'add_search',
+            query=query,
+            city=city,
+            price_min=price_min,
+            price_max=price_max,
+            delivery=delivery,
+            on_done=self._on_saved,
+            on_error=self._on_save_error
+        )
+
+    def _on_saved(self, search_id):
+        messagebox.showinfo("Выполнено!",
+                            f"Поисковый запрос добавлен (ID: {search_id})")
+        self.on_success()  # Обновляем список в главном окне
+        self.destroy()
+
+    def _on_save_error(self, error):
+        self.save_button.config(state=tk.NORMAL, text="Сохранить")
+        messagebox.showerror("Ошибка базы данных",
+                             f"Не удалось сохранить запрос: {error}")
 
 
 class DetailsWindow(tk.Toplevel):
@@ -156,9 +167,12 @@ class DetailsWindow(tk.Toplevel):
 class SearchItemsWindow(tk.Toplevel):
     """Окно для просмотра истории объявлений по конкретному запросу."""
 
-    def __init__(self, parent, db, search_id, search_name, parent_app=None):
+    PAGE_SIZE = 100  # Сколько объявлений подгружается за раз
+
+    def __init__(self, parent, db_worker, search_id, search_name,
+                 parent_app=None):
         super().__init__(parent)  # parent - это окно Tkinter (self.root)
-        self.db = db
+        self.db_worker = db_worker
         self.search_id = search_id
         self.title(f"История: {search_name}")
         self.geometry("900x500")
@@ -166,6 +180,14 @@ class SearchItemsWindow(tk.Toplevel):
         # Сохранение ссылки на AvitoTrackerApp
         self.parent_app = parent_app
 
+        # Курсор постраничной загрузки (found_date, id последней строки)
+        self._page_cursor = None
+        self._has_more = True
+        self._page_loading = False
+        # Номер загрузки: ответы на запросы до нажатия "Обновить"
+        # отбрасываются
+        self._generation = 0
+
         main_frame = ttk.Frame(self, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
 
@@ -195,11 +217,12 @@ class SearchItemsWindow(tk.Toplevel):
         self.tree.tag_configure('new', background='#e8f5e9')
         self.tree.tag_configure('viewed', background='white')
 
-        # Полоса прокрутки
-        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL,
-                                  command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Полоса прокрутки (при прокрутке к концу подгружается следующая
+        # страница объявлений)
+        self.scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL,
+                                       command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         # Панель кнопок
         button_frame = ttk.Frame(self)
@@ -214,6 +237,11 @@ class SearchItemsWindow(tk.Toplevel):
         ttk.Button(button_frame, text="Обновить",
                    command=self._load_items).pack(side=tk.LEFT, padx=5)
 
+        # Индикатор загрузки
+        self.loading_label = ttk.Label(button_frame, text="",
+                                       foreground="gray")
+        self.loading_label.pack(side=tk.RIGHT, padx=5)
+
         # Загрузка данных
         self._load_items()
 
@@ -224,22 +252,52 @@ class SearchItemsWindow(tk.Toplevel):
         self.tree.bind('<Button-3>', self._on_right_click)
 
     def _load_items(self):
-        """Загружает объявления из базы данных и отображает их в таблице."""
+        """Загружает первую страницу объявлений из базы данных и отображает
+        их в таблице."""
         # Очистка текущих данных
         for item in self.tree.get_children():  # Возвр. список id всех строк
             self.tree.delete(item)
 
-        items = self.db.get_items_by_search_id(self.search_id)
+        self._page_cursor = None
+        self._has_more = True
+        self._page_loading = False
+        self._generation += 1
+        self._load_next_page()
+
+    def _load_next_page(self):
+        """Запрашивает следующую страницу объявлений (в фоновом потоке)."""
+        if not self._has_more or self._page_loading:
+            return
+        self._page_loading = True
+        self.loading_label.config(text="Загрузка...")
+        generation = self._generation
+        self.db_worker.call(
+            'get_items_page', self.search_id, self.PAGE_SIZE,
+            after=self._page_cursor,
+            on_done=lambda items: self._show_page(generation, items),
+            on_error=lambda error: self._on_page_error(generation, error))
+
+    def _show_page(self, generation, items):
+        """Добавляет полученную страницу объявлений в конец таблицы."""
+        if generation != self._generation or not self.winfo_exists():
+            return
+        self._page_loading = False
+        self.loading_label.config(text="")
+        self._has_more = len(items) == self.PAGE_SIZE
+        if not items:
+            return
+
         for item in items:
-            # Правильные индексы согласно структуре БД
+            # Порядок полей: id, title, price, link, date, delivery,
+            # fitting, is_new, found_date
             item_id = item[0]
-            title = item[2]
-            price = item[3]
-            link = item[5]
-            date = item[7]
-            delivery = "ДА" if item[9] == 1 else "НЕТ"
-            fitting = "ДА" if item[10] == 1 else "НЕТ"
-            is_new = item[13]
+            title = item[1]
+            price = item[2]
+            link = item[3]
+            date = item[4]
+            delivery = "ДА" if item[5] == 1 else "НЕТ"
+            fitting = "ДА" if item[6] == 1 else "НЕТ"
+            is_new = item[7]
 
             # Определяем тег в зависимости от статуса + ссылка
             tags = ('new', link) if is_new else ('viewed', link)
@@ -251,15 +309,35 @@ class SearchItemsWindow(tk.Toplevel):
                              ),
                              tags=tags)
 
-        # Пометка всех загруженных объявлений is_new = 0
-        self.db.mark_items_as_viewed(self.search_id)
+        self._page_cursor = (items[-1][8], items[-1][0])
+
+        # Пометка показанных объявлений is_new = 0
+        new_ids = [item[0] for item in items if item[7]]
+        if new_ids:
+            self.db_worker.call('mark_items_as_viewed', self.search_id,
+                                new_ids)
+
+    def _on_page_error(self, generation, error):
+        if generation != self._generation or not self.winfo_exists():
+            return
+        self._page_loading = False
+        self.loading_label.config(text="Ошибка загрузки")
+        print(f"Не удалось загрузить объявления: {error}")
+
+    def _on_tree_scroll(self, first, last):
+        """Прокрутка таблицы: обновляет полосу прокрутки и подгружает
+        следующую страницу у конца списка."""
+        self.scrollbar.set(first, last)
+        if self._has_more and not self._page_loading \
+                and float(last) > 0.9:
+            self._load_next_page()
 
     def _mark_single_as_read(self, item_id):
         """Помечает одно объявление как прочитанное."""
 
         # ID объявления из первого столбца
         item_db_id = self.tree.item(item_id)['values'][0]
-        self.db.mark_item_as_viewed(item_db_id)
+        self.db_worker.call('mark_item_as_viewed', item_db_id)
 
         # Преобразование кортежа в список для изменения тегов
         current_tags = list(self.tree.item(item_id, 'tags'))
@@ -295,9 +373,11 @@ class SearchItemsWindow(tk.Toplevel):
         selected_items = self.tree.selection()
         if not selected_items:
             return
+        # Запросы выполняются по очереди, поэтому перезагрузка списка
+        # увидит уже удалённые объявления
         for item in selected_items:
             item_id = self.tree.item(item)['values'][0]
-            self.db.delete_item(item_id)
+            self.db_worker.call('delete_item', item_id)
         self._load_items()  # Перезагружаем список
 
         if hasattr(self.parent_app, '_load_searches'):
@@ -316,10 +396,14 @@ class SearchItemsWindow(tk.Toplevel):
     def _show_details(self):
         selected = self.tree.selection()[0]
         item_id = self.tree.item(selected)['values'][0]
-        item_data = self.db.get_item_by_id(item_id)  # Новый метод в Database
 
+        self.db_worker.call('get_item_by_id', item_id,
+                            on_done=self._open_details)
+
+    def _open_details(self, item_data):
         # Окно с описанием и фото
-        DetailsWindow(self, item_data)
+        if item_data and self.winfo_exists():
+            DetailsWindow(self, item_data)
 
 
 class AvitoTrackerApp:
@@ -328,6 +412,8 @@ class AvitoTrackerApp:
     def __init__(self, root, db, scheduler, tracker):
         self.root = root
         self.db = db
+        # Все обращения GUI к базе идут через фоновый поток
+        self.db_worker = DbWorker(db, root, on_busy=self._on_db_busy)
         self.scheduler = scheduler
         self.tracker = tracker
         self.root.title("Avito Tracker")
@@ -345,7 +431,8 @@ class AvitoTrackerApp:
 
         # Кнопки управления фоновой проверкой
         ttk.Button(toolbar, text="▶️ Запустить проверку",
-                   command=self.scheduler.start).pack(side=tk.RIGHT, padx=5)
+                   command=self._start_scheduler).pack(side=tk.RIGHT,
+                                                       padx=5)
         ttk.Button(toolbar, text="⏸️ Остановить проверку",
                    command=self.scheduler.stop).pack(side=tk.RIGHT)
 
@@ -392,6 +479,16 @@ class AvitoTrackerApp:
         )
         self.checking_indicator.pack(side=tk.LEFT, padx=2)
 
+        # Индикатор обращения к базе данных
+        self.loading_label = ttk.Label(self.status_bar, text="",
+                                       foreground="gray")
+        self.loading_label.pack(side=tk.RIGHT, padx=5)
+
+        # Средняя длительность фаз проверки (см. metrics.py)
+        self.metrics_label = ttk.Label(self.status_bar, text="",
+                                       foreground="gray")
+        self.metrics_label.pack(side=tk.RIGHT, padx=5)
+
         # Полоса прокрутки
         scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL,
                                   command=self.tree.yview)
@@ -406,24 +503,17 @@ class AvitoTrackerApp:
 
     def _load_searches(self):
         """Загружает список активных поисковых запросов из БД."""
+        # Получение запросов и счётчиков из бд одним запросом (в фоновом
+        # потоке, таблица обновится по готовности)
+        self.db_worker.call('get_dashboard_rows', on_done=self._show_searches)
+
+    def _show_searches(self, rows):
+        """Отображает полученный список запросов в таблице."""
         # Очищение текущих данных из таблицы
         for item in self.tree.get_children():
             self.tree.delete(item)
 
-        # Получение запросов из бд
-        searches = self.db.get_active_searches()
-
-        for search in searches:
-            search_id = search[0]  # id
-            name = search[1]  # name
-            city = search[3]  # city
-            last_check = search[10]  # last_check
-
-            total_count = self.db.get_total_count(search_id)
-
-            # Количество новых объявлений
-            new_count = self.db.get_new_items_count(search_id)
-
+        for search_id, name, city, total_count, new_count, last_check in rows:
             if last_check:
                 try:
                     from datetime import datetime
@@ -448,6 +538,10 @@ class AvitoTrackerApp:
                 self.tree.tag_configure('has_new', background='#f0fff0')
                 self.tree.item(item_id, tags=('has_new',))
 
+    def _on_db_busy(self, busy):
+        """Показывает, что GUI ждёт ответа базы данных"""
+        self.loading_label.config(text="Загрузка данных..." if busy else "")
+
     # Реализация колбэков
     def on_check_start(self):
         """Вызывается при начале фоновой проверки"""
@@ -461,6 +555,8 @@ class AvitoTrackerApp:
         """Вызывается при завершении фоновой проверки"""
         # Обновление списка запросов
         self._load_searches()
+        # Где тратится время проверки (Chrome, сайт или база)
+        self.metrics_label.config(text=metrics.registry.summary())
 
         # Обновление строки состояния
         if new_items_total_count > 0:
@@ -489,7 +585,7 @@ class AvitoTrackerApp:
 
     def _open_add_dialog(self):
         """Открывает диалог добавления нового запроса."""
-        AddSearchDialog(self.root, self.db, self._load_searches)
+        AddSearchDialog(self.root, self.db_worker, self._load_searches)
 
     def _open_search_history(self, event):
         """Открывает окно истории для выбранного поискового запроса."""
@@ -498,9 +594,16 @@ class AvitoTrackerApp:
             return
         search_data = self.tree.item(selected_item[0])['values']
         search_id, search_name = search_data[0], search_data[1]
-        SearchItemsWindow(self.root, self.db, search_id, search_name,
+        SearchItemsWindow(self.root, self.db_worker, search_id, search_name,
                           parent_app=self)
 
+    def _start_scheduler(self):
+        """Запуск фоновой проверки (кнопка)"""
+        if not self.scheduler.start():
+            messagebox.showinfo("Проверка",
+                                "Предыдущая проверка ещё завершается, "
+                                "попробуйте позже")
+
     def _delete_search(self):
         """Удаляет выбранный поисковый запрос из БД."""
         selected = self.tree.selection()
@@ -522,9 +625,11 @@ class AvitoTrackerApp:
             return
 
         # Удаление из БД
-        try:
-            self.db.delete_search(search_id)  # Этот метод нужно добавить
-            self._load_searches()  # Обновляем список
-            messagebox.showinfo("Выполнено!", "Запрос удален.")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось удалить запрос: {e}")
+        self.db_worker.call('delete_search', search_id,
+                            on_done=self._on_search_deleted,
+                            on_error=lambda e: messagebox.showerror(
+                                "Ошибка", f"Не удалось удалить запрос: {e}"))
+
+    def _on_search_deleted(self, _result):
+        self._load_searches()  # Обновляем список
+        messagebox.showinfo("Выполнено!", "Запрос удален.")
@@ -0,0 +1,132 @@
+"""
+Модуль извлечения объявлений из готового HTML (page_source или
+сохранённой страницы) без живого браузера.
+Возвращает такие же словари, как ImprovedAvitoParser._extract_data_from_container.
+Функция extract_items не зависит от драйвера, поэтому её можно выполнять
+в отдельном процессе (например, ProcessPoolExecutor.submit).
+"""
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+# lxml (requirements.txt) разбирает выдачу в несколько раз быстрее
+# html.parser; встроенный парсер - только запасной вариант
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    print("lxml не установлен, разбор HTML через html.parser (медленнее)")
+    HTML_PARSER = 'html.parser'
+
+BASE_URL = "https://www.avito.ru"
+
+DESCRIPTION_SELECTORS = [
+    'meta[itemprop="description"]',
+    '[data-marker="item-description"]',
+    '.item-description',
+    '[class*="description"]'
+]
+IMAGE_SELECTORS = [
+    'img[data-marker="item-image"]',
+    'img[itemprop="image"]',
+    'img[class*="image"]',
+    'source[type="image/jpeg"]'
+]
+LOCATION_SELECTORS = [
+    '[data-marker="item-location"]',
+    '[class*="geo-address"]',
+    '[class*="address"]',
+    '.style-item-address-H3k6v'
+]
+
+
+def _text(elem):
+    """Текст элемента (аналог WebElement.text)"""
+    return elem.get_text(" ", strip=True)
+
+
+def _first_text(container, selectors):
+    # Первый непустой текст по списку селекторов
+    for selector in selectors:
+        elem = container.select_one(selector)
+        if not elem:
+            continue
+        if selector.startswith('meta'):
+            text = elem.get('content') or ""
+        else:
+            text = _text(elem)
+        if text:
+            return text
+    return ""
+
+
+def extract_item(container, base_url=BASE_URL):
+    """Извлечение данных одного объявления. Возвращает словарь/None"""
+    title_elem = container.select_one('[data-marker="item-title"]')
+    if not title_elem:
+        return None
+    title = _text(title_elem)
+    href = title_elem.get('href')
+    link = urljoin(base_url, href) if href else "No link"
+
+    description = _first_text(container, DESCRIPTION_SELECTORS)
+
+    # Первое фото
+    image_url = None
+    for selector in IMAGE_SELECTORS:
+        img_elem = container.select_one(selector)
+        if not img_elem:
+            continue
+        temp_url = img_elem.get('src') or img_elem.get('data-src')
+        if temp_url and temp_url != "No image":
+            image_url = urljoin(base_url, temp_url.split(';')[0])
+            break
+
+    if not title or not image_url:
+        return None
+
+    price = _first_text(container, ['[data-marker="item-price"]'])
+    location = _first_text(container, LOCATION_SELECTORS)
+    date = _first_text(container, ['[data-marker="item-date"]'])
+
+    # Примерка и доставка
+    container_text = _text(container)
+    fitting = "Можно примерить" in container_text
+    delivery = "Доставка" in container_text
+
+    return {
+        'title': title,
+        'price': price or "Не указана",
+        'link': link,
+        'date': date or "Не указано",
+        'location': location or "Не указано",
+        'delivery': delivery,
+        'fitting': fitting,
+        'image_url': image_url,
+        'description': description
+    }
+
+
+def extract_items(html, base_url=BASE_URL):
+    """Извлечение всех объявлений страницы. Возвращает список словарей"""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    items = []
+    for container in soup.select('[data-marker="item"]'):
+        item_data = extract_item(container, base_url)
+        if item_data:
+            items.append(item_data)
+    return items
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "test_files/avito_debug.html"
+    with open(path, encoding="utf-8") as f:
+        page_items = extract_items(f.read())
+
+    print(f"Найдено {len(page_items)} объявлений ({HTML_PARSER})")
+    for i, item in enumerate(page_items[:3], 1):
+        print(f"\n--- Объявление {i} ---")
+        for key, value in item.items():
+            print(f"{key}: {value}")
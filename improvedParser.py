@@ -14,17 +14,303 @@ from selenium.webdriver.common.action_chains import \
     ActionChains  # Цепочки действий
 import undetected_chromedriver as uc
 import re
+from html_extractor import extract_items, BASE_URL
+from timing import TimingPolicy
+import metrics
+
+
+# Признаки выдачи без объявлений ("Ничего не найдено")
+EMPTY_RESULT_SELECTORS = [
+    '[data-marker="search-empty-result"]',
+    '[data-marker*="no-results"]',
+]
+EMPTY_RESULT_TEXTS = [
+    "Ничего не найдено",
+    "По вашему запросу ничего не найдено",
+]
+
+# Извлечение всех объявлений страницы за один вызов execute_script.
+# Повторяет логику _extract_data_from_container (те же селекторы и
+# значения по умолчанию), но без отдельного HTTP-запроса к WebDriver
+# на каждое поле.
+EXTRACT_ITEMS_SCRIPT = '''
+    const firstText = (root, selectors) => {
+        for (const selector of selectors) {
+            const elem = root.querySelector(selector);
+            if (!elem) continue;
+            const text = selector.startsWith('meta')
+                ? (elem.getAttribute('content') || '')
+                : elem.innerText.trim();
+            if (text) return text;
+        }
+        return '';
+    };
+    const items = [];
+    const containers = document.querySelectorAll('[data-marker="item"]');
+    for (const container of containers) {
+        const mainElem = container.querySelector('[data-marker="item-title"]');
+        if (!mainElem) continue;
+        const title = mainElem.innerText.trim();
+        const link = mainElem.href || mainElem.getAttribute('href') || 'No link';
+
+        const description = firstText(container, [
+            'meta[itemprop="description"]',
+            '[data-marker="item-description"]',
+            '.item-description',
+            '[class*="description"]'
+        ]);
+
+        let imageUrl = null;
+        const imgSelectors = [
+            'img[data-marker="item-image"]',
+            'img[itemprop="image"]',
+            'img[class*="image"]',
+            'source[type="image/jpeg"]'
+        ];
+        for (const selector of imgSelectors) {
+            const img = container.querySelector(selector);
+            if (!img) continue;
+            let url = img.getAttribute('src') ? img.src
+                : img.getAttribute('data-src');
+            if (url && url !== 'No image') {
+                imageUrl = url.split(';')[0];
+                break;
+            }
+        }
+        if (!title || !imageUrl) continue;
+
+        const price = firstText(container, ['[data-marker="item-price"]']);
+        const location = firstText(container, [
+            '[data-marker="item-location"]',
+            '[class*="geo-address"]',
+            '[class*="address"]',
+            '.style-item-address-H3k6v'
+        ]);
+        const date = firstText(container, ['[data-marker="item-date"]']);
+
+        const containerText = container.innerText;
+        let fitting = containerText.includes('Можно примерить');
+        let delivery = containerText.includes('Доставка');
+        if (!fitting) {
+            const badge = container.querySelector('[data-marker*="iva-item/"]');
+            fitting = !!badge && badge.innerText.includes('Можно примерить');
+        }
+        if (!delivery) {
+            const block = container.querySelector('[class*="delivery-root"]');
+            delivery = !!block && block.innerText.includes('Доставка');
+        }
+
+        items.push({
+            title: title,
+            price: price || 'Не указана',
+            link: link,
+            date: date || 'Не указано',
+            location: location || 'Не указано',
+            delivery: delivery,
+            fitting: fitting,
+            image_url: imageUrl,
+            description: description
+        });
+    }
+    return items;
+'''
+
+
+# Ресурсы, не нужные для извлечения объявлений (шаблоны Network.setBlockedURLs).
+# Атрибуты src у картинок остаются в DOM, не скачиваются только сами файлы.
+BLOCKED_RESOURCES = [
+    # Изображения (на Avito картинки отдаются с *.img.avito.st без расширения)
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg',
+    '*.ico', '*img.avito.st*',
+    # Видео и аудио
+    '*.mp4', '*.webm', '*.mp3', '*.m3u8',
+    # Шрифты
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    # Сторонняя аналитика и реклама
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*mc.yandex.ru*', '*an.yandex.ru*', '*top-fwz1.mail.ru*',
+    '*ad.mail.ru*', '*vk.com/rtrg*',
+]
+# Стили блокируются отдельно: без них часть элементов может считаться
+# невидимой (is_displayed в _wait_for_captcha)
+BLOCKED_STYLES = ['*.css']
+
+# Сводка по загруженным ресурсам страницы из Resource Timing API
+RESOURCE_REPORT_SCRIPT = '''
+    const entries = performance.getEntriesByType('navigation')
+        .concat(performance.getEntriesByType('resource'));
+    const report = {requests: 0, bytes: 0, duration_ms: 0, by_type: {}};
+    for (const entry of entries) {
+        const type = entry.initiatorType || 'other';
+        const bytes = entry.transferSize || 0;
+        report.requests += 1;
+        report.bytes += bytes;
+        report.duration_ms = Math.max(report.duration_ms, entry.responseEnd);
+        const stats = report.by_type[type] || (report.by_type[type] = {
+            requests: 0, bytes: 0});
+        stats.requests += 1;
+        stats.bytes += bytes;
+    }
+    return report;
+'''
+
+
+def create_driver(headless=True, block_resources=False, block_css=False):
+    """
+    Минималистичная настройка драйвера. Возвращает driver/None
+    Args:
+        block_resources: Не загружать картинки, медиа, шрифты и аналитику.
+        block_css: Дополнительно не загружать стили.
+    """
+    started = time.perf_counter()
+    try:
+        options = uc.ChromeOptions()
+
+        if headless:
+            options.add_argument('--headless=new')
+            options.add_argument('--window-size=1920,1080')
+            options.add_argument('--disable-gpu')  # Важно для headless
+        # Только самые необходимые аргументы
+        else:
+            options.add_argument('--start-maximized')
+
+        options.add_argument(
+            '--disable-blink-features=AutomationControlled')
+        options.add_argument('--no-sandbox')
+        # driver.get() возвращается после DOMContentLoaded, дальнейшая
+        # готовность страницы определяется TimingPolicy
+        options.page_load_strategy = 'eager'
+        # options.add_argument(
+        #     '--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+        #     'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
+
+        driver = uc.Chrome(options=options)
+
+        # Базовая маскировка
+        # driver.execute_script(
+        #     "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+            'source': '''
+                // Обход hCaptcha детекции
+                Object.defineProperty(navigator, 'webdriver', {
+                    get: () => undefined
+                });
+
+                // Обход QRATOR fingerprinting (кол-во плагинов)
+                Object.defineProperty(navigator, 'plugins', {
+                    get: () => [1, 2, 3, 4, 5]
+                });
+
+                Object.defineProperty(navigator, 'languages', {
+                    get: () => ['ru-RU', 'ru', 'en-US', 'en']
+                });
+
+                // Скрытие Chrome Automation
+                window.chrome = {
+                    runtime: {},
+                    loadTimes: function() {},
+                    csi: function() {},
+                    app: {}
+                };
+            '''
+        })
+
+        # Блокировка ненужных ресурсов (экономия трафика и CPU)
+        blocked_urls = []
+        if block_resources:
+            blocked_urls += BLOCKED_RESOURCES
+        if block_css:
+            blocked_urls += BLOCKED_STYLES
+        if blocked_urls:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs',
+                                   {'urls': blocked_urls})
+        metrics.observe(metrics.PHASE_SECONDS, time.perf_counter() - started,
+                        phase="driver_startup")
+        return driver
+    except Exception as e:
+        print(f"Ошибка настройки драйвера: {e}")
+        return None
+
+
+def get_resource_report(driver):
+    """
+    Сводка по ресурсам текущей страницы: количество запросов, переданные
+    байты и время загрузки (в т.ч. по типам ресурсов). Возвращает словарь/None
+    """
+    try:
+        return driver.execute_script(RESOURCE_REPORT_SCRIPT)
+    except Exception:
+        return None
+
+
+def format_resource_report(report):
+    """Строка с кратким отчётом по ресурсам для вывода в консоль"""
+    by_type = ', '.join(
+        f"{resource_type}: {stats['requests']} / {stats['bytes'] // 1024} КБ"
+        for resource_type, stats in sorted(report['by_type'].items()))
+    return (f"Ресурсы: {report['requests']} запросов, "
+            f"{report['bytes'] // 1024} КБ, {report['duration_ms'] / 1000:.1f} с"
+            f" ({by_type})")
 
 
 class ImprovedAvitoParser:
     def __init__(self, city, query, price_min=None, price_max=None,
-                 delivery=False):
+                 delivery=False, driver=None, extraction_mode="script",
+                 timing=None, session_store=None, session_key="default",
+                 block_resources=False, block_css=False, known_links=None,
+                 known_stop_count=3, throttle=None, base_url=BASE_URL,
+                 recorder=None):
         self.city = city
         self.query = query
         self.price_min = price_min
         self.price_max = price_max
         self.delivery = delivery
-        self.driver = None
+        # Внешний драйвер (например, из DriverPool) не закрывается парсером
+        self.driver = driver
+        self.owns_driver = driver is None
+        self.pages_loaded = 0  # Кол-во загруженных страниц (для пула)
+        # Способ извлечения: "script" - все объявления одним execute_script,
+        # "html" - разбор page_source без браузера (html_extractor),
+        # "elements" - поэлементно через find_element (медленно)
+        self.extraction_mode = extraction_mode
+        # Политика ожиданий вместо фиксированных пауз
+        self.timing = timing or TimingPolicy()
+        # Хранилище тёплых сессий (SessionStore): при тёплой сессии
+        # главная страница и имитация поведения на ней пропускаются
+        self.session_store = session_store
+        self.session_key = session_key
+        # Блокировка ресурсов для собственного драйвера (для драйверов
+        # из пула настраивается в DriverPool)
+        self.block_resources = block_resources
+        self.block_css = block_css
+        # Раннее прекращение парсинга: known_links(links) возвращает
+        # множество уже известных ссылок. Выдача отсортирована по дате,
+        # поэтому после known_stop_count известных объявлений подряд
+        # остальные считаются старыми (несколько подряд - из-за
+        # закреплённых платных объявлений, которые стоят выше по выдаче)
+        self.known_links = known_links
+        self.known_stop_count = known_stop_count
+        self.reached_known = False
+        # Общий ограничитель частоты запросов к домену (DomainThrottle) -
+        # при параллельной проверке нескольких запросов
+        self.throttle = throttle
+        # Адрес сайта (для локального тестового сервера - mock_avito.py)
+        self.base_url = base_url.rstrip('/')
+        # Запись обработанных страниц в архив (SessionRecorder) для
+        # повторного прогона извлечения без сети
+        self.recorder = recorder
+        self.last_extracted = None  # Объявления страницы до отсечения
+        # Итог последнего запуска: "ok", "empty" (объявлений нет),
+        # "blocked" (капча/блокировка), "timeout" (объявления не
+        # дождались), "no_driver" (браузер не запустился) или "error"
+        self.last_status = None
+        # Причина последней неудачи _wait_for_captcha: "captcha",
+        # "blocked" или "timeout"
+        self.block_reason = None
+        # Последняя страница поиска - выдача без объявлений
+        self.page_empty = False
 
     # Возвращает driver/None
     # def _setup_undetected_driver(self, headless=True):
@@ -100,59 +386,9 @@ class ImprovedAvitoParser:
 
     def _setup_undetected_driver(self, headless=True):
         """Минималистичная настройка драйвера"""
-        try:
-            options = uc.ChromeOptions()
-
-            if headless:
-                options.add_argument('--headless=new')
-                options.add_argument('--window-size=1920,1080')
-                options.add_argument('--disable-gpu')  # Важно для headless
-            # Только самые необходимые аргументы
-            else:
-                options.add_argument('--start-maximized')
-
-            options.add_argument(
-                '--disable-blink-features=AutomationControlled')
-            options.add_argument('--no-sandbox')
-            # options.add_argument(
-            #     '--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-            #     'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-
-            driver = uc.Chrome(options=options)
-
-            # Базовая маскировка
-            # driver.execute_script(
-            #     "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-
-            driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
-                'source': '''
-                    // Обход hCaptcha детекции
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    });
-
-                    // Обход QRATOR fingerprinting (кол-во плагинов)
-                    Object.defineProperty(navigator, 'plugins', {
-                        get: () => [1, 2, 3, 4, 5]
-                    });
-
-                    Object.defineProperty(navigator, 'languages', {
-                        get: () => ['ru-RU', 'ru', 'en-US', 'en']
-                    });
-
-                    // Скрытие Chrome Automation
-                    window.chrome = {
-                        runtime: {},
-                        loadTimes: function() {},
-                        csi: function() {},
-                        app: {}
-                    };
-                '''
-            })
-            return driver
-        except Exception as e:
-            print(f"Ошибка настройки драйвера: {e}")
-            return None
+        return create_driver(headless=headless,
+                             block_resources=self.block_resources,
+                             block_css=self.block_css)
 
     # Возвращает True/False (занимает максимум 30 с.)
     def _wait_for_captcha(self, timeout=30, headless=True):
@@ -162,9 +398,16 @@ class ImprovedAvitoParser:
             timeout: Максимальное время ожидания в секундах.
             headless: Флаг, работает ли браузер в режиме без графического интерфейса.
         Returns:
-            True - если капчи нет или она решена. False - если обнаружена неустранимая блокировка.
+            True - если капчи нет или она решена (или на странице признаки
+            пустой выдачи - тогда page_empty = True). False - если
+            обнаружена неустранимая блокировка или объявления не появились
+            (block_reason = "timeout").
         """
 
+        self.block_reason = None
+        self.page_empty = False
+        # С какого момента страница загружена полностью, а объявлений нет
+        loaded_since = None
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
@@ -204,12 +447,13 @@ class ImprovedAvitoParser:
                             "ОБНАРУЖЕНА КАПЧА В HEADLESS-РЕЖИМЕ. Парсинг невозможен.")
                         # Сохранение скриншота для отладки
                         self.driver.save_screenshot("captcha_blocked.png")
+                        self.block_reason = "captcha"
                         return False  # Завершение работы с ошибкой
                     else:
                         # В видимом режиме нужно решить капчу вручную
                         print("Требуется ручное решение капчи в браузере...")
                         input("Решите капчу и нажмите Enter для продолжения: ")
-                        time.sleep(3)
+                        self.timing.jitter()
                         continue
 
                 # Проверка наличия явной блокировки
@@ -224,6 +468,7 @@ class ImprovedAvitoParser:
                 for indicator in block_indicators:
                     if indicator in page_visible_text:
                         print(f"Обнаружена блокировка: '{indicator}'")
+                        self.block_reason = "blocked"
                         return False  # Неустранимая блокировка
 
                 # Если загрузились нормальные объявления - выходим
@@ -236,11 +481,43 @@ class ImprovedAvitoParser:
                 except Exception:
                     pass
 
+                # Выдача без объявлений - не блокировка и не таймаут
+                # (только по явным признакам пустой выдачи)
+                if self._is_empty_result(page_visible_text):
+                    print("Ничего не найдено")
+                    self.page_empty = True
+                    return True
+                # Страница загружена полностью, но ни объявлений, ни
+                # признаков пустой выдачи нет - вероятно, неизвестная
+                # проверка или заглушка: это таймаут, а не пустая выдача
+                if self.driver.execute_script(
+                        "return document.readyState") == "complete":
+                    loaded_since = loaded_since or time.time()
+                    if time.time() - loaded_since >= self.timing.empty_grace:
+                        print("Страница загружена без объявлений и без "
+                              "признаков пустой выдачи")
+                        break
+                else:
+                    loaded_since = None
+
                     # Если ничего не найдено, ждём и проверяем снова
-                time.sleep(2)
+                time.sleep(self.timing.poll_interval)
             except Exception:
                 pass
         print("Таймаут: не удалось дождаться загрузки объявлений.")
+        self.block_reason = "timeout"
+        return False
+
+    # Возвращает True, если на странице признаки пустой выдачи
+    def _is_empty_result(self, page_visible_text):
+        if any(text in page_visible_text for text in EMPTY_RESULT_TEXTS):
+            return True
+        for selector in EMPTY_RESULT_SELECTORS:
+            try:
+                if self.driver.find_elements(By.CSS_SELECTOR, selector):
+                    return True
+            except Exception:
+                pass
         return False
 
     # Ничего не возвращает (занимает максимум 22 с.)
@@ -259,7 +536,7 @@ class ImprovedAvitoParser:
 
         for x, y in scroll_sequences:
             driver.execute_script(f"window.scrollBy({x}, {y});")
-            time.sleep(random.uniform(0.5, 1.5))
+            self.timing.pause(self.timing.scroll_pause)
 
             # Случайные движения мышью
             try:
@@ -282,7 +559,7 @@ class ImprovedAvitoParser:
                     actions.move_to_element(random_element).click().pause(
                         1).perform()
                     # print("Случайный клик")
-                    time.sleep(random.uniform(1, 3))
+                    self.timing.pause(self.timing.click_pause)
                 except:
                     pass
         except:
@@ -291,7 +568,7 @@ class ImprovedAvitoParser:
     # Возвращает строку url
     def _build_search_url(self, page=1):
         # Формирование URL для поиска
-        base_url = f"https://www.avito.ru/{self.city}"
+        base_url = f"{self.base_url}/{self.city}"
         encoded_query = quote_plus(self.query)
 
         params = [f"q={encoded_query}", "s=104"]  # Сортировка по дате
@@ -314,64 +591,136 @@ class ImprovedAvitoParser:
         print("Запуск парсера")
         print("=" * 50)
 
-        self.driver = self._setup_undetected_driver(headless=headless)
+        if self.owns_driver:
+            self.driver = self._setup_undetected_driver(headless=headless)
         if not self.driver:
             print("Не удалось инициализировать драйвер")
+            self.last_status = "no_driver"
             return []
         all_items = []
+        self.last_status = "ok"
 
-        # Занимает максимум 120 с.
+        timing = self.timing
         try:
             for page in range(1, max_pages + 1):
                 print(f"Страница {page}/{max_pages}")
-                # Переход на главную страницу
+                # Переход на главную страницу (если сессия не тёплая)
                 if page == 1:
-                    self.driver.get("https://www.avito.ru/")
-                    time.sleep(random.uniform(5, 8))
-                    # Имитация поведения на главной
-                    self._advanced_human_behavior()
+                    self._warm_up()
                 # Переход на страницу поиска
                 search_url = self._build_search_url(page)
-                self.driver.get(search_url)
-
-                # Длительная задержка для обхода Qrator
-                wait_time = random.uniform(8, 15)
-                time.sleep(wait_time)
-
-                if not self._wait_for_captcha(headless=headless):
-                    print("Не удалось обойти защиту")
-                    break
-
-                self._advanced_human_behavior()
-
-                # Парсинг объявлений на странице
-                items = self._parse_page()
-                if items:
-                    all_items.extend(items)
-                    # print(f"Найдено {len(items)} объявлений")
-                else:
+                self._throttle(search_url)
+                with timing.phase("search_page"):
+                    self.driver.get(search_url)
+                    self.pages_loaded += 1
+                    timing.wait_dom_ready(self.driver)
+
+                items = self._process_search_page(page, headless=headless)
+                if items is None:
+                    self.last_status = "timeout" \
+                        if self.block_reason == "timeout" else "blocked"
+                    break  # Капча или блокировка
+                all_items.extend(items)
+                if self.reached_known:
+                    break  # Дальше только старые объявления
+                if not items:
                     print("Не удалось найти объявления")
+                    if page == 1:
+                        self.last_status = "empty"
                     break
 
                 # Пауза между страницами
                 if page < max_pages:
-                    delay = random.uniform(10, 20)
+                    delay = random.uniform(*timing.page_delay)
                     print(
                         f"Пауза {delay:.1f} сек перед следующей страницей")
                     time.sleep(delay)
 
         except Exception as e:
             print(f"Ошибка: {e}")
+            self.last_status = "error"
         finally:
-            if self.driver:
+            if self.driver and self.owns_driver:
                 try:
                     self.driver.quit()
                 except Exception:
                     pass  # Игнорируем любые ошибки при закрытии
+            timing.log_timings()
 
         print(f"Найдено: {len(all_items)} объявлений")
         return all_items
 
+    # Ничего не возвращает. Заход на главную (если сессия не тёплая)
+    def _warm_up(self):
+        if self._restore_warm_session():
+            return
+        timing = self.timing
+        self._throttle(self.base_url + "/")
+        with timing.phase("homepage"):
+            self.driver.get(self.base_url + "/")
+            self.pages_loaded += 1
+            timing.wait_dom_ready(self.driver)
+            timing.jitter()
+        # Имитация поведения на главной
+        if timing.human_behavior:
+            with timing.phase("human_behavior"):
+                self._advanced_human_behavior()
+
+    # Ничего не возвращает. Ожидание очереди запроса к домену (если задан
+    # ограничитель частоты)
+    def _throttle(self, url):
+        if self.throttle:
+            self.throttle.wait(url)
+
+    # Возвращает список объявлений или None (капча/блокировка)
+    def _process_search_page(self, page=1, headless=True):
+        # Обработка уже открытой страницы поиска
+        timing = self.timing
+        # Ожидание первого объявления (или капчи/блокировки)
+        with timing.phase("captcha_wait"):
+            passed = self._wait_for_captcha(
+                timeout=timing.items_timeout, headless=headless)
+        if not passed:
+            self._record_page(self.block_reason, None)
+            print("Не удалось обойти защиту")
+            if self.session_store:
+                self.session_store.invalidate(self.session_key, self.driver)
+            return None
+        if self.page_empty:
+            self._record_page("empty", [])
+            return []
+
+        with timing.phase("network_idle"):
+            timing.wait_network_idle(self.driver)
+            timing.jitter()
+
+        if timing.human_behavior:
+            with timing.phase("human_behavior"):
+                self._advanced_human_behavior()
+
+        # Парсинг объявлений на странице
+        with timing.phase("extraction"):
+            items = self._parse_page()
+        self._record_page("ok", self.last_extracted)
+
+        report = get_resource_report(self.driver)
+        if report:
+            print(format_resource_report(report))
+        # Защита пройдена - сессию можно переиспользовать
+        if self.session_store and page == 1:
+            self.session_store.save(self.session_key, self.driver)
+        return items
+
+    # Возвращает True, если сессия тёплая и главную страницу можно пропустить
+    def _restore_warm_session(self):
+        store = self.session_store
+        if not store or not store.is_warm(self.session_key):
+            return False
+        if store.restore(self.session_key, self.driver):
+            print(f"Используется тёплая сессия '{self.session_key}'")
+            return True
+        return False
+
     # Занимает максимум 15 с.
     def _parse_page(self):
         # Парсинг одной страницы
@@ -382,39 +731,107 @@ class ImprovedAvitoParser:
             wait.until(EC.presence_of_element_located(
                 (By.CSS_SELECTOR, '[data-marker="item"]')))
 
+            self.last_extracted = None
+            if self.extraction_mode == "script":
+                return self._cut_at_known(
+                    self._remember(self._extract_with_script()))
+            if self.extraction_mode == "html":
+                return self._cut_at_known(
+                    self._remember(self._parse_from_page_source()))
+
             containers = self.driver.find_elements(By.CSS_SELECTOR,
                                                    '[data-marker="item"]')
             print(f"Найдено контейнеров: {len(containers)}")
 
-            items = []
-            for container in containers:  # Ограничиваем для скорости
-                item_data = self._extract_data_from_container(container)
-                if item_data:
-                    items.append(item_data)
-
-            return items
+            # Генератор: после остановки на известном объявлении
+            # оставшиеся контейнеры не извлекаются
+            extracted = (self._extract_data_from_container(container)
+                         for container in containers)
+            extracted = (item_data for item_data in extracted if item_data)
+            if self.recorder:
+                # Для записи нужны все объявления страницы
+                extracted = self._remember(list(extracted))
+            return self._cut_at_known(extracted)
 
         except TimeoutException:
             print("Таймаут при загрузке объявлений")
             # Пробуем парсить из исходного кода
-            return self._parse_from_page_source()
+            return self._cut_at_known(
+                self._remember(self._parse_from_page_source()))
         except Exception as e:
             print(f"Ошибка парсинга: {e}")
             return []
 
+    # Возвращает items. Запоминает объявления страницы до отсечения
+    # известных (для записи страницы)
+    def _remember(self, items):
+        self.last_extracted = items
+        return items
+
+    # Ничего не возвращает. Запись текущей страницы в архив (если задан
+    # recorder): HTML, замеры фаз и извлечённые объявления
+    def _record_page(self, status, items):
+        if not self.recorder:
+            return
+        try:
+            self.recorder.record(
+                url=self.driver.current_url,
+                html=self.driver.page_source,
+                items=items,
+                status=status,
+                timings=self.timing.timings,
+                extraction_mode=self.extraction_mode,
+                base_url=self.base_url)
+        except Exception as e:
+            print(f"Не удалось записать страницу: {e}")
+
+    # Возвращает список новых объявлений (до первых известных)
+    def _cut_at_known(self, items):
+        if not self.known_links:
+            return list(items)
+        if isinstance(items, list):
+            # Одна проверка в бд на всю страницу
+            known = self.known_links([item['link'] for item in items])
+            is_known = known.__contains__
+        else:
+            # Поштучная проверка (контейнеры извлекаются лениво)
+            is_known = lambda link: bool(self.known_links([link]))
+
+        new_items = []
+        known_in_row = 0
+        for item in items:
+            if not is_known(item['link']):
+                known_in_row = 0
+                new_items.append(item)
+                continue
+            known_in_row += 1
+            if known_in_row >= self.known_stop_count:
+                print(f"Достигнуто известное объявление, "
+                      f"новых: {len(new_items)}")
+                self.reached_known = True
+                break
+        return new_items
+
+    # Возвращает список словарей (один вызов к WebDriver)
+    def _extract_with_script(self):
+        items = self.driver.execute_script(EXTRACT_ITEMS_SCRIPT) or []
+        print(f"Извлечено объявлений (script): {len(items)}")
+        return items
+
     def _parse_from_page_source(self):
-        # Аварийный парсинг из исходного кода
+        # Парсинг из исходного кода страницы (один запрос page_source)
         try:
             source = self.driver.page_source
-            items = []
-            # Сохраняем HTML для отладки
-            with open("test_files/avito_debug.html", "w", encoding="utf-8") as f:
-                f.write(source)
-            print("HTML сохранен как avito_debug.html")
+            items = extract_items(source, self.base_url)
+            print(f"Извлечено объявлений (page_source): {len(items)}")
 
-            # Простой поиск по ключевым словам в исходном коде
-            if self.query.lower() in source.lower():
-                print("Запрос найден в исходном коде")
+            if not items:
+                # Сохраняем HTML для отладки
+                os.makedirs("test_files", exist_ok=True)
+                with open("test_files/avito_debug.html", "w",
+                          encoding="utf-8") as f:
+                    f.write(source)
+                print("HTML сохранен как avito_debug.html")
 
             return items
         except Exception as e:
@@ -700,6 +1117,122 @@ class ImprovedAvitoParser:
 
 
 
+def _open_tab(driver, url):
+    """
+    Открывает url в новой вкладке, не дожидаясь загрузки и не переключаясь
+    на неё. window.open не используется: undetected_chromedriver запускает
+    Chrome без --disable-popup-blocking, и всплывающее окно может быть
+    заблокировано. Возвращает handle вкладки или None.
+    """
+    known_handles = set(driver.window_handles)
+    try:
+        # Вкладка через CDP открывается в фоне и сразу начинает загрузку
+        target = driver.execute_cdp_cmd(
+            'Target.createTarget', {'url': url, 'background': True})
+    except Exception:
+        target = None
+    new_handles = [handle for handle in driver.window_handles
+                   if handle not in known_handles]
+    if new_handles:
+        return new_handles[0]
+    if target:
+        return None  # Вкладка создана, но WebDriver её не видит
+
+    # Без CDP: новая вкладка средствами WebDriver, загрузка без ожидания
+    current_handle = driver.current_window_handle
+    try:
+        driver.switch_to.new_window('tab')
+        handle = driver.current_window_handle
+        driver.execute_script("window.location.href = arguments[0];", url)
+        return handle
+    except Exception as e:
+        print(f"Не удалось открыть вкладку: {e}")
+        return None
+    finally:
+        try:
+            driver.switch_to.window(current_handle)
+        except Exception:
+            pass
+
+
+def parse_in_tabs(driver, parsers, headless=True):
+    """
+    Проверка нескольких запросов в одном браузере: каждый парсер получает
+    свою вкладку, все вкладки загружаются параллельно, затем объявления
+    извлекаются по очереди.
+    Args:
+        driver: Общий драйвер (не закрывается).
+        parsers: Список ImprovedAvitoParser (по одному на запрос).
+    Returns:
+        Список результатов в порядке parsers: список объявлений или None,
+        если вкладку не удалось обработать (капча/блокировка/ошибка).
+        Запросы, для которых вкладка не открылась, проверяются по очереди
+        в основной вкладке.
+    """
+    results = [None] * len(parsers)
+    if not parsers:
+        return results
+    for parser in parsers:
+        parser.driver = driver
+        parser.owns_driver = False
+
+    main_handle = driver.current_window_handle
+    tabs = []
+    try:
+        # Главная страница открывается один раз для всех вкладок
+        parsers[0]._warm_up()
+
+        # Открытие вкладок без ожидания загрузки - загрузки идут параллельно
+        for parser in parsers:
+            search_url = parser._build_search_url()
+            parser._throttle(search_url)
+            handle = _open_tab(driver, search_url)
+            if handle is not None:
+                parser.pages_loaded += 1
+            tabs.append(handle)
+            parser.timing.jitter()
+
+        # Извлечение по очереди из готовых вкладок; без вкладки - загрузка
+        # в основной вкладке
+        for index, (parser, handle) in enumerate(zip(parsers, tabs)):
+            try:
+                if handle is None:
+                    print(f"Вкладка для '{parser.query}' не открылась, "
+                          f"загрузка в основной вкладке")
+                    driver.switch_to.window(main_handle)
+                    search_url = parser._build_search_url()
+                    parser._throttle(search_url)
+                    with parser.timing.phase("search_page"):
+                        driver.get(search_url)
+                        parser.pages_loaded += 1
+                        parser.timing.wait_dom_ready(driver)
+                else:
+                    driver.switch_to.window(handle)
+                    with parser.timing.phase("search_page"):
+                        parser.timing.wait_dom_ready(driver)
+                results[index] = parser._process_search_page(
+                    headless=headless)
+            except Exception as e:
+                print(f"Ошибка во вкладке '{parser.query}': {e}")
+            finally:
+                parser.timing.log_timings()
+    finally:
+        # Закрытие всех открытых вкладок и возврат на основную
+        for handle in tabs:
+            if handle is None:
+                continue
+            try:
+                driver.switch_to.window(handle)
+                driver.close()
+            except Exception:
+                pass
+        try:
+            driver.switch_to.window(main_handle)
+        except Exception:
+            pass
+    return results
+
+
 if __name__ == "__main__":
     print("Тестируем парсер с обходом защиты:")
 
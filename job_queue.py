@@ -0,0 +1,124 @@
+"""
+Модуль обработчиков очереди проверок.
+Планировщик (демон с "queue": true в настройках) не проверяет запросы
+сам, а ставит их в таблицу check_jobs. Обработчики в других процессах
+берут задания с арендой, проверяют запросы (результаты сохраняются
+через Database.process_items) и отмечают задания выполненными. Пока
+идёт проверка, аренда продлевается фоновым потоком; если обработчик
+завершился аварийно, аренда истекает и задание берёт другой обработчик.
+Задание, аренда которого истекла max_attempts раз подряд, получает
+состояние dead и больше не выдаётся (вернуть в очередь:
+python main.py retry-jobs).
+
+Очередь работает только на одной машине: база SQLite в режиме WAL
+использует общую память процессов (файл -shm) и не может находиться на
+сетевом диске (NFS, SMB) - обработчики на разных машинах с общим файлом
+базы могут её повредить.
+
+Запуск нескольких обработчиков на одной машине:
+    python main.py worker --processes 3
+"""
+import os
+import socket
+import threading
+
+
+class CheckWorker:
+    """
+    Обработчик очереди check_jobs.
+    Args:
+        tracker: AvitoTracker (проверки и база данных).
+        worker_id: Имя обработчика в таблице (по умолчанию хост-pid).
+        batch_size: Сколько заданий брать за раз (проверяются одним
+            циклом трекера: во вкладках/потоках по его настройкам).
+        lease_seconds: Длительность аренды задания.
+        poll_seconds: Пауза между обращениями к пустой очереди.
+        max_attempts: Сколько раз задание может потерять аренду, прежде
+            чем получит состояние dead (None - без ограничения).
+    """
+
+    def __init__(self, tracker, worker_id=None, batch_size=1,
+                 lease_seconds=300, poll_seconds=5, max_attempts=3):
+        self.tracker = tracker
+        self.db = tracker.db
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.jobs_done = 0
+
+    def run(self, stop_event):
+        """Обработка заданий до stop_event. Невыполненные задания при
+        остановке возвращаются в очередь"""
+        print(f"Обработчик {self.worker_id} запущен")
+        try:
+            while not stop_event.is_set():
+                try:
+                    search_ids = self.db.claim_check_jobs(
+                        self.worker_id, limit=self.batch_size,
+                        lease_seconds=self.lease_seconds,
+                        max_attempts=self.max_attempts)
+                except Exception as e:
+                    print(f"Обработчик {self.worker_id}: ошибка очереди: {e}")
+                    search_ids = []
+                if not search_ids:
+                    stop_event.wait(self.poll_seconds)
+                    continue
+                self.process(search_ids)
+        finally:
+            self.db.release_check_jobs(self.worker_id)
+            print(f"Обработчик {self.worker_id} остановлен "
+                  f"(заданий: {self.jobs_done})")
+
+    def process(self, search_ids):
+        """Проверка взятых заданий с продлением аренды"""
+        print(f"Обработчик {self.worker_id}: задания {search_ids}")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat,
+                                     args=(search_ids, done),
+                                     name="heartbeat", daemon=True)
+        heartbeat.start()
+        report = []
+        try:
+            self.tracker.check_all_active_searches(search_ids=search_ids)
+            report = self.tracker.last_cycle_report
+        except Exception as e:
+            print(f"Обработчик {self.worker_id}: ошибка проверки: {e}")
+            report = [{'search_id': search_id, 'status': "error",
+                       'error': str(e)} for search_id in search_ids]
+        finally:
+            done.set()
+            heartbeat.join()
+
+        for result in report:
+            finished = self.db.finish_check_job(
+                self.worker_id, result['search_id'], result['status'],
+                result['error'])
+            if not finished:
+                # Аренда истекла и задание взял другой обработчик. Найденные
+                # объявления уже сохранены - повторная проверка их не
+                # задублирует (ссылка уникальна в пределах запроса)
+                print(f"Обработчик {self.worker_id}: аренда запроса "
+                      f"{result['search_id']} потеряна")
+            self.jobs_done += 1
+
+    def _heartbeat(self, search_ids, done):
+        """Продление аренды, пока идёт проверка"""
+        interval = max(1, self.lease_seconds / 3)
+        try:
+            while not done.wait(interval):
+                try:
+                    held = self.db.extend_check_leases(
+                        self.worker_id, search_ids,
+                        lease_seconds=self.lease_seconds)
+                except Exception as e:
+                    print(f"Обработчик {self.worker_id}: не удалось продлить "
+                          f"аренду: {e}")
+                    continue
+                lost = set(search_ids) - set(held)
+                if lost:
+                    print(f"Обработчик {self.worker_id}: аренда запросов "
+                          f"{sorted(lost)} потеряна")
+        finally:
+            self.db.release_thread_connection()
@@ -1,6 +1,327 @@
-# Точка входа, GUI и основной цикл
-from tracker import AvitoTracker
+"""
+Точка входа Avito Tracker.
 
-def main():
-    tracker = AvitoTracker()
-    # запуск GUI и основного цикла
\ No newline at end of file
+    python main.py gui      - окно программы с фоновыми проверками
+    python main.py daemon   - фоновые проверки без окна (для сервера):
+                              состояние по HTTP (/status, /metrics)
+    python main.py check    - один цикл проверки всех запросов и выход
+    python main.py worker   - обработчик очереди проверок (job_queue.py);
+                              --processes N - несколько процессов
+    python main.py retry-jobs - вернуть в очередь задания в состоянии dead
+    python main.py rebuild-counters - сверка и пересчёт счётчиков
+
+Общие параметры: --config (JSON-файл настроек, см. config.py), --db.
+Tk и PIL загружаются только командой gui.
+"""
+import argparse
+import multiprocessing
+import signal
+import threading
+import time
+from datetime import datetime
+
+from config import load_config
+
+# Сколько секунд при завершении ждать окончания текущей проверки
+SHUTDOWN_TIMEOUT = 60
+
+
+def build_tracker(config):
+    """AvitoTracker со всеми компонентами по настройкам config"""
+    from database import Database
+    from tracker import AvitoTracker
+
+    db = Database(config["db_path"])
+    driver_pool = None
+    if config["pool_size"]:
+        from driver_pool import DriverPool
+        driver_pool = DriverPool(size=config["pool_size"],
+                                 headless=config["headless"],
+                                 block_resources=config["block_resources"],
+                                 block_css=config["block_css"])
+    session_store = None
+    if config["sessions_dir"]:
+        from session_store import SessionStore
+        session_store = SessionStore(config["sessions_dir"])
+    recorder = None
+    if config["recordings_dir"]:
+        from session_recorder import SessionRecorder
+        recorder = SessionRecorder(config["recordings_dir"])
+
+    options = {}
+    if config["base_url"]:
+        options["base_url"] = config["base_url"]
+    return AvitoTracker(
+        db,
+        check_interval_minutes=config["check_interval"],
+        driver_pool=driver_pool,
+        session_store=session_store,
+        tabs_per_driver=config["tabs_per_driver"],
+        use_http=config["use_http"],
+        max_workers=config["max_workers"],
+        domain_interval=config["domain_interval"],
+        notify=config["notify"],
+        recorder=recorder,
+        metrics_path=config["metrics_path"],
+        headless=config["headless"],
+        block_resources=config["block_resources"],
+        block_css=config["block_css"],
+        **options
+    )
+
+
+def build_scheduler(tracker, config):
+    from scheduler import Scheduler
+    dispatch = None
+    if config["queue"]:
+        # Проверки выполняют обработчики очереди (python main.py worker)
+        dispatch = tracker.db.enqueue_check_jobs
+    return Scheduler(tracker, interval=config["check_interval"],
+                     min_interval=config["min_interval"],
+                     max_interval=config["max_interval"],
+                     dispatch=dispatch)
+
+
+def shutdown(tracker, scheduler=None):
+    """Остановка проверок и освобождение ресурсов: браузеры пула, архив
+    записи, соединения с базой"""
+    if scheduler is not None:
+        scheduler.stop(wait=True, timeout=SHUTDOWN_TIMEOUT)
+        if scheduler.is_running:
+            print("Проверка не завершилась вовремя, браузеры закрываются")
+    if tracker.driver_pool:
+        tracker.driver_pool.close_all()
+    if tracker.recorder:
+        tracker.recorder.close()
+    if tracker.metrics_path:
+        import metrics
+        try:
+            metrics.registry.write_json(tracker.metrics_path)
+        except OSError as e:
+            print(f"Не удалось сохранить метрики: {e}")
+    tracker.db.close()
+
+
+def daemon_status(tracker, scheduler, started_at):
+    """Состояние демона для /status"""
+    import metrics
+    schedule = [
+        {'search_id': search_id,
+         'next_check': datetime.fromtimestamp(due).isoformat(
+             timespec='seconds'),
+         'interval_minutes': round(interval, 1) if interval else None}
+        for search_id, due, interval in scheduler.get_schedule()]
+    last_cycle = [
+        {'search_id': result['search_id'], 'name': result['name'],
+         'status': result['status'],
+         'new_items': len(result['new_items']),
+         'error': result['error'],
+         'seconds': round(result['seconds'], 1)}
+        for result in tracker.last_cycle_report]
+    status = {
+        'started': datetime.fromtimestamp(started_at).isoformat(
+            timespec='seconds'),
+        'uptime_seconds': round(time.time() - started_at),
+        'checking': scheduler.is_running,
+        'circuit_open': bool(tracker.backoff and tracker.backoff.is_open()),
+        'schedule': schedule,
+        'last_cycle': last_cycle,
+        'phases': metrics.registry.summary(),
+    }
+    if scheduler.dispatch:
+        status['jobs'] = [
+            {'search_id': search_id, 'state': state, 'due_at': due_at,
+             'worker': worker, 'lease_until': lease_until,
+             'attempts': attempts, 'last_status': last_status,
+             'last_error': last_error}
+            for search_id, state, due_at, worker, lease_until, attempts,
+            last_status, last_error in tracker.db.get_check_jobs()]
+    return status
+
+
+def run_daemon(config):
+    """Фоновые проверки без окна до SIGINT/SIGTERM"""
+    tracker = build_tracker(config)
+    scheduler = build_scheduler(tracker, config)
+    started_at = time.time()
+    stop_event = threading.Event()
+
+    def handle_signal(signum, _frame):
+        print(f"Получен сигнал {signal.Signals(signum).name}, завершение...")
+        stop_event.set()
+        # Повторный сигнал завершает программу сразу
+        signal.signal(signum, signal.SIG_DFL)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    server = None
+    if config["status_port"]:
+        from metrics import MetricsServer
+        server = MetricsServer(
+            host=config["status_host"], port=config["status_port"],
+            status=lambda: daemon_status(tracker, scheduler, started_at))
+        server.start()
+
+    try:
+        scheduler.start()
+        # Ожидание с таймаутом - сигналы обрабатываются в основном потоке
+        while not stop_event.wait(1):
+            pass
+    finally:
+        if server:
+            server.stop()
+        shutdown(tracker, scheduler)
+    print("Демон остановлен")
+
+
+def run_gui(config):
+    """Окно программы с фоновыми проверками"""
+    import tkinter as tk
+    from gui import AvitoTrackerApp
+
+    tracker = build_tracker(config)
+    scheduler = build_scheduler(tracker, config)
+    root = tk.Tk()
+    app = AvitoTrackerApp(root, tracker.db, scheduler, tracker)
+    # Колбэки планировщика вызываются в его потоке - обновление окна
+    # передаётся в поток Tk
+    scheduler.on_check_start = lambda: root.after(0, app.on_check_start)
+    scheduler.on_check_complete = \
+        lambda count: root.after(0, app.on_check_complete, count)
+
+    def on_close():
+        scheduler.stop()
+        app.db_worker.close()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    try:
+        root.mainloop()
+    finally:
+        shutdown(tracker, scheduler)
+
+
+def run_workers(config, processes=1):
+    """Обработчики очереди проверок (в этом процессе или в processes
+    дочерних процессах) до SIGINT/SIGTERM"""
+    stop_event = threading.Event()
+
+    def handle_signal(signum, _frame):
+        print(f"Получен сигнал {signal.Signals(signum).name}, завершение...")
+        stop_event.set()
+        signal.signal(signum, signal.SIG_DFL)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    if processes <= 1:
+        _worker_process(config, stop_event, handle_signals=False)
+        return
+
+    # Отдельное событие для дочерних процессов: multiprocessing.Event
+    # нельзя устанавливать из обработчика сигнала, пока основной поток
+    # ждёт это же событие (взаимная блокировка)
+    children_stop = multiprocessing.Event()
+    children = [multiprocessing.Process(target=_worker_process,
+                                        args=(config, children_stop),
+                                        name=f"worker-{index}")
+                for index in range(processes)]
+    for child in children:
+        child.start()
+    # Ожидание с таймаутом - сигналы обрабатываются в основном потоке
+    while not stop_event.wait(1):
+        if not any(child.is_alive() for child in children):
+            break
+    children_stop.set()
+    for child in children:
+        child.join()
+
+
+def _worker_process(config, stop_event, handle_signals=True):
+    """Один обработчик очереди (цель дочернего процесса)"""
+    from job_queue import CheckWorker
+    if handle_signals:
+        # Завершением управляет родительский процесс (stop_event)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    tracker = build_tracker(config)
+    try:
+        CheckWorker(tracker, batch_size=config["worker_batch"],
+                    lease_seconds=config["lease_seconds"],
+                    max_attempts=config["max_attempts"]).run(stop_event)
+    finally:
+        shutdown(tracker)
+
+
+def run_check(config):
+    """Один цикл проверки всех активных запросов"""
+    tracker = build_tracker(config)
+    try:
+        new_items = tracker.check_all_active_searches()
+        print(f"Всего новых объявлений: {len(new_items)}")
+    finally:
+        shutdown(tracker)
+
+
+def retry_jobs(config):
+    """Возврат в очередь заданий, которые получили состояние dead"""
+    from database import Database
+    db = Database(config["db_path"])
+    try:
+        count = db.retry_dead_check_jobs()
+        print(f"Возвращено в очередь заданий: {count}")
+    finally:
+        db.close()
+
+
+def rebuild_counters(config):
+    """Сверка счётчиков объявлений с таблицей items и пересчёт"""
+    from database import Database
+    db = Database(config["db_path"])
+    try:
+        mismatches = db.check_counters(repair=True)
+        for search_id, total, actual_total, new, actual_new in mismatches:
+            print(f"Запрос {search_id}: всего {total} -> {actual_total}, "
+                  f"новых {new} -> {actual_new}")
+        print(f"Исправлено запросов: {len(mismatches)}")
+    finally:
+        db.close()
+
+
+COMMANDS = {
+    "gui": run_gui,
+    "daemon": run_daemon,
+    "check": run_check,
+    "worker": run_workers,
+    "retry-jobs": retry_jobs,
+    "rebuild-counters": rebuild_counters,
+}
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Avito Tracker")
+    arg_parser.add_argument("command", nargs="?", default="gui",
+                            choices=sorted(COMMANDS))
+    arg_parser.add_argument("--config", default=None,
+                            help="JSON-файл настроек (по умолчанию "
+                                 "config.json, если есть)")
+    arg_parser.add_argument("--db", dest="db_path", default=None,
+                            help="файл базы данных")
+    arg_parser.add_argument("--status-port", type=int, default=None,
+                            help="порт HTTP-статуса демона (0 - без него)")
+    arg_parser.add_argument("--processes", type=int, default=1,
+                            help="количество процессов-обработчиков "
+                                 "(команда worker)")
+    args = arg_parser.parse_args(argv)
+
+    config = load_config(args.config, db_path=args.db_path,
+                         status_port=args.status_port)
+    if args.command == "worker":
+        run_workers(config, processes=args.processes)
+    else:
+        COMMANDS[args.command](config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Модуль метрик конвейера проверки.
+Гистограммы длительности фаз (запуск Chrome, главная страница, переход к
+поиску, ожидание капчи, имитация действий, извлечение, запись в базу,
+уведомления) и счётчики итогов проверок. Метрики доступны:
+    - в формате Prometheus по HTTP (MetricsServer, /metrics);
+    - в JSON по HTTP (/metrics.json) или в файле (Metrics.write_json);
+    - краткой строкой для строки состояния GUI (Metrics.summary).
+
+Замер фазы:
+    with metrics.span("extraction"):
+        ...
+Фазы TimingPolicy (timing.py) попадают в метрики автоматически.
+
+Запуск отдельно (просмотр файла метрик):
+    python metrics.py [metrics.json]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм (секунды)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Имена метрик
+PHASE_SECONDS = "avito_phase_seconds"  # Фазы проверки (метка phase)
+CHECK_SECONDS = "avito_check_seconds"  # Проверка запроса (метка status)
+CYCLE_SECONDS = "avito_cycle_seconds"  # Цикл проверки всех запросов
+CHECKS_TOTAL = "avito_checks_total"  # Итоги проверок (метка status)
+NEW_ITEMS_TOTAL = "avito_new_items_total"  # Найдено новых объявлений
+
+# Фазы для строки состояния GUI (фаза -> подпись)
+SUMMARY_PHASES = (
+    ("driver_startup", "Chrome"),
+    ("homepage", "главная"),
+    ("search_page", "поиск"),
+    ("http_fetch", "HTTP"),
+    ("captcha_wait", "капча"),
+    ("extraction", "извлечение"),
+    ("db_ingest", "БД"),
+    ("notification", "уведомления"),
+)
+
+
+class _Histogram:
+    """Служебная гистограмма: накопленные счётчики по корзинам"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.last = None
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.last = value
+
+
+class Metrics:
+    """
+    Реестр метрик (потокобезопасный).
+    Args:
+        buckets: Границы корзин гистограмм (секунды, по возрастанию).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}  # (имя, метки) -> _Histogram
+        self._counters = {}  # (имя, метки) -> значение
+        self.started_at = time.time()
+
+    def observe(self, name, seconds, **labels):
+        """Добавляет замер в гистограмму name с метками labels"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1, **labels):
+        """Увеличивает счётчик name с метками labels"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def span(self, phase):
+        """Замер длительности фазы (гистограмма PHASE_SECONDS)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(PHASE_SECONDS, time.perf_counter() - start,
+                         phase=phase)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """Текущие значения метрик (словарь, пригодный для JSON)"""
+        with self._lock:
+            histograms = [
+                {'name': name, 'labels': dict(labels),
+                 'count': histogram.count, 'sum': round(histogram.sum, 4),
+                 'last': histogram.last,
+                 'buckets': [[bound, count] for bound, count
+                             in zip(self.buckets, histogram.counts)]}
+                for (name, labels), histogram
+                in sorted(self._histograms.items())]
+            counters = [{'name': name, 'labels': dict(labels),
+                         'value': value}
+                        for (name, labels), value
+                        in sorted(self._counters.items())]
+        return {
+            'updated': datetime.now().isoformat(timespec='seconds'),
+            'started': datetime.fromtimestamp(self.started_at)
+            .isoformat(timespec='seconds'),
+            'histograms': histograms,
+            'counters': counters,
+        }
+
+    def to_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        return format_prometheus(self.snapshot())
+
+    def write_json(self, path):
+        """Сохраняет snapshot в файл (атомарно - читатель не увидит
+        недописанный файл)"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+
+    def summary(self):
+        """Краткая строка для строки состояния: средняя длительность фаз"""
+        return summarize(self.snapshot())
+
+
+def format_prometheus(snapshot):
+    """snapshot (Metrics.snapshot или файл JSON) -> текст Prometheus"""
+    lines = []
+    declared = set()
+    for histogram in snapshot['histograms']:
+        name = histogram['name']
+        if name not in declared:
+            lines.append(f"# TYPE {name} histogram")
+            declared.add(name)
+        cumulative = 0
+        for bound, count in histogram['buckets']:
+            cumulative += count
+            labels = _labels(histogram['labels'], le=f"{bound:g}")
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _labels(histogram['labels'], le="+Inf")
+        lines.append(f"{name}_bucket{labels} {histogram['count']}")
+        labels = _labels(histogram['labels'])
+        lines.append(f"{name}_sum{labels} {histogram['sum']}")
+        lines.append(f"{name}_count{labels} {histogram['count']}")
+    for counter in snapshot['counters']:
+        name = counter['name']
+        if name not in declared:
+            lines.append(f"# TYPE {name} counter")
+            declared.add(name)
+        lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize(snapshot):
+    """snapshot -> строка "Chrome 4.2 с | поиск 2.1 с | ..." (средние
+    по фазам, которые уже замерялись)"""
+    means = {}
+    for histogram in snapshot['histograms']:
+        if histogram['name'] == PHASE_SECONDS and histogram['count']:
+            phase = histogram['labels'].get('phase')
+            means[phase] = histogram['sum'] / histogram['count']
+    parts = [f"{label} {means[phase]:.{1 if means[phase] >= 1 else 2}f} с"
+             for phase, label in SUMMARY_PHASES if phase in means]
+    return " | ".join(parts)
+
+
+def read_json(path):
+    """snapshot из файла write_json или None, если файла нет"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    parts = []
+    for key, value in items:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+# Общий реестр программы
+registry = Metrics()
+
+
+def span(phase):
+    """Замер фазы в общем реестре (см. Metrics.span)"""
+    return registry.span(phase)
+
+
+def observe(name, seconds, **labels):
+    registry.observe(name, seconds, **labels)
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+class MetricsServer:
+    """
+    HTTP-сервер метрик в фоновом потоке (только для локальных запросов).
+    /metrics - формат Prometheus, /metrics.json - JSON, /status - JSON
+    функции status (если задана).
+    Args:
+        metrics: Реестр (по умолчанию общий).
+        port: Порт (0 - любой свободный).
+        status: Функция без аргументов, возвращающая словарь состояния
+            (например, состояние демона в main.py).
+    """
+
+    def __init__(self, metrics=None, host="127.0.0.1", port=9108,
+                 status=None):
+        self.metrics = metrics or registry
+        self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.metrics = self.metrics
+        self._server.status = status
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="metrics", daemon=True)
+        self._thread.start()
+        print(f"Метрики: {self.url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics = self.server.metrics
+        path = self.path.split('?')[0].rstrip('/')
+        if path in ("", "/metrics"):
+            body = metrics.to_prometheus()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body = json.dumps(metrics.snapshot(), ensure_ascii=False)
+            content_type = "application/json; charset=utf-8"
+        elif path == "/status" and self.server.status:
+            body = json.dumps(self.server.status(), ensure_ascii=False,
+                              default=str)
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Без вывода каждого запроса
+
+
+if __name__ == "__main__":
+    snapshot = read_json(sys.argv[1] if len(sys.argv) > 1 else "metrics.json")
+    if snapshot is None:
+        print("Файл метрик не найден")
+    else:
+        print(format_prometheus(snapshot), end="")
+        print(f"# {summarize(snapshot)}")
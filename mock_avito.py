@@ -0,0 +1,243 @@
+"""
+Локальный тестовый сервер вместо avito.ru.
+Отдаёт сохранённые (test_files/*.html) или сгенерированные страницы
+поиска, страницы капчи и блокировки с настраиваемой задержкой. Нужен
+для повторяемых замеров парсеров без сети и антибот-защиты (benchmark.py).
+
+Парсеры направляются на сервер параметром base_url:
+    with MockAvitoServer(latency=0.2) as server:
+        parser = AvitoParser(city="moskva", query="куртка",
+                             base_url=server.base_url)
+
+Запуск отдельно: python mock_avito.py [--port 8000] [--latency 0.2]
+    [--mode ok|captcha|blocked|empty] [--pages test_files]
+"""
+import argparse
+import glob
+import html
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Режимы ответа на страницу поиска
+MODES = ("ok", "captcha", "blocked", "empty")
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>{title}</title></head>
+<body>{body}</body></html>'''
+
+ITEM_TEMPLATE = '''
+<div data-marker="item" class="iva-item-root">
+  <a data-marker="item-title" itemprop="url" href="/{city}/odezhda_obuv_aksessuary/{slug}_{item_id}"><h3>{title}</h3></a>
+  <meta itemprop="description" content="{description}">
+  <img data-marker="item-image" itemprop="image" src="/img/{item_id}.jpg" width="200" height="150">
+  <span data-marker="item-price"><meta itemprop="price" content="{price}">{price_text}</span>
+  <div data-marker="item-location">{city}</div>
+  <p data-marker="item-date">{minutes} минут назад</p>
+  {extras}
+</div>'''
+
+CAPTCHA_BODY = '''
+<div class="captcha-container" style="width:400px;height:200px">
+  <h2>Please confirm you are human</h2>
+</div>'''
+
+BLOCKED_BODY = '''
+<h1>Доступ ограничен: проблема с IP</h1>
+<p>Подозрительная активность с вашего IP-адреса.</p>'''
+
+# Картинка 1x1 (GIF) для всех изображений объявлений
+PIXEL_GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!'
+             b'\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00'
+             b'\x00\x02\x02D\x01\x00;')
+
+
+class MockAvitoServer:
+    """
+    Тестовый HTTP-сервер в фоновом потоке.
+    Args:
+        pages_dir: Папка с сохранёнными страницами поиска (*.html). Если
+            страниц нет - страницы генерируются.
+        latency: Задержка перед каждым ответом (секунды).
+        mode: Ответ на страницу поиска: "ok", "captcha", "blocked" (403 и
+            текст блокировки) или "empty" (выдача без объявлений).
+        items_per_page: Объявлений на сгенерированной странице.
+        port: Порт (0 - любой свободный).
+    Атрибуты mode и latency можно менять во время работы.
+    """
+
+    def __init__(self, pages_dir=None, latency=0.0, mode="ok",
+                 items_per_page=50, port=0):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим: {mode}")
+        self.latency = latency
+        self.mode = mode
+        self.items_per_page = items_per_page
+        self.pages = []
+        if pages_dir:
+            for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+                with open(path, encoding="utf-8") as f:
+                    self.pages.append(f.read())
+
+        self._fresh = 0  # Сколько "новых" объявлений появилось сверху выдачи
+        self._lock = threading.Lock()
+        self.counts = {}  # Вид запроса -> количество
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self):
+        """Всего обработанных запросов"""
+        with self._lock:
+            return sum(self.counts.values())
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts = {}
+
+    def add_new_items(self, count):
+        """Добавляет count новых объявлений в начало сгенерированной
+        выдачи (как будто их только что опубликовали)"""
+        with self._lock:
+            self._fresh += count
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="mock-avito", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, kind):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def search_page(self, city, params):
+        """Страница поиска (статус, HTML) в текущем режиме"""
+        if self.mode == "captcha":
+            return 200, PAGE_TEMPLATE.format(title="Капча", body=CAPTCHA_BODY)
+        if self.mode == "blocked":
+            return 403, PAGE_TEMPLATE.format(title="Доступ ограничен",
+                                             body=BLOCKED_BODY)
+        if self.mode == "empty":
+            return 200, PAGE_TEMPLATE.format(
+                title="Ничего не найдено", body="<h2>Ничего не найдено</h2>")
+        if self.pages:
+            # Сохранённые страницы отдаются по очереди
+            with self._lock:
+                page = self.pages[self.counts.get("search", 1)
+                                  % len(self.pages)]
+            return 200, page
+        return 200, self._generate_page(city, params)
+
+    def _generate_page(self, city, params):
+        """Выдача с объявлениями, подходящими под запрос и цены.
+        Одинаковый запрос даёт одинаковую выдачу"""
+        query = params.get('q', [''])[0]
+        page = int(params.get('p', ['1'])[0])
+        price_min = int(params.get('pmin', ['500'])[0])
+        price_max = int(params.get('pmax', [str(price_min + 20000)])[0])
+        delivery = params.get('d', ['0'])[0] == '1'
+        with self._lock:
+            fresh = self._fresh
+
+        rng = random.Random(f"{city}|{query}|{page}|{fresh}")
+        top_id = 4000000000 + fresh - (page - 1) * self.items_per_page
+        words = query.split() or ["Товар"]
+        items = []
+        for index in range(self.items_per_page):
+            item_id = top_id - index
+            # Цена зависит только от объявления (одинакова на всех страницах)
+            price = random.Random(item_id).randint(price_min,
+                                                   max(price_min, price_max))
+            title = f"{' '.join(words).capitalize()} №{item_id % 100000}"
+            extras = []
+            if delivery or rng.random() < 0.5:
+                extras.append("<span>Доставка</span>")
+            if rng.random() < 0.3:
+                extras.append("<span>Можно примерить</span>")
+            items.append(ITEM_TEMPLATE.format(
+                city=html.escape(city), slug="_".join(words).lower(),
+                item_id=item_id, title=html.escape(title),
+                description=html.escape(f"Описание: {title}"),
+                price=price, price_text=f"{price:,}".replace(",", "\u00a0")
+                + "\u00a0₽",
+                minutes=index + 1, extras="".join(extras)))
+        return PAGE_TEMPLATE.format(title=html.escape(query),
+                                    body="".join(items))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        mock = self.server.mock
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        parts = urlsplit(self.path)
+        path = parts.path.strip('/')
+        if path.startswith("img/"):
+            mock._count("image")
+            self._send(200, PIXEL_GIF, "image/gif")
+        elif path == "":
+            mock._count("home")
+            body = PAGE_TEMPLATE.format(
+                title="Авито", body='<h1>Авито</h1><a href="/moskva">Москва</a>')
+            self._send(200, body)
+        elif "/" not in path and path != "favicon.ico":
+            mock._count("search")
+            status, body = mock.search_page(path, parse_qs(parts.query))
+            self._send(status, body)
+        else:
+            mock._count("other")
+            self._send(404, PAGE_TEMPLATE.format(title="404", body="404"))
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Без вывода каждого запроса
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Тестовый сервер Avito")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--mode", choices=MODES, default="ok")
+    arg_parser.add_argument("--pages", default=None,
+                            help="папка с сохранёнными страницами поиска")
+    args = arg_parser.parse_args()
+
+    server = MockAvitoServer(pages_dir=args.pages, latency=args.latency,
+                             mode=args.mode, port=args.port)
+    print(f"Тестовый сервер: {server.base_url} (режим {args.mode})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
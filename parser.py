@@ -1,25 +1,49 @@
 import requests
 import time
 import random
-from bs4 import BeautifulSoup
 from urllib.parse import quote_plus
 
+from html_extractor import extract_items, BASE_URL
+import metrics
+
+# Признаки страницы блокировки/капчи (как в ImprovedAvitoParser)
+BLOCK_INDICATORS = [
+    "Доступ ограничен",
+    "Подозрительная активность",
+    "Системы безопасности",
+    "Please confirm you are human",
+]
+
 
 class AvitoParser:
-    def __init__(self, city, query, price_min=None, price_max=None, delivery=False, fitting=False):
+    def __init__(self, city, query, price_min=None, price_max=None,
+                 delivery=False, fitting=False, session=None, throttle=None,
+                 base_url=BASE_URL, jitter=(0, 2), recorder=None):
         self.city = city
         self.query = query
         self.price_min = price_min
         self.price_max = price_max
         self.delivery = delivery
-        self.session = requests.Session()
+        # Общая сессия позволяет переиспользовать keep-alive соединения
+        # между запросами разных поисков
+        self.session = session or requests.Session()
         self.set_headers()
+        self.last_status_code = None
+        # Общий ограничитель частоты запросов к домену (DomainThrottle)
+        self.throttle = throttle
+        # Адрес сайта (для локального тестового сервера - mock_avito.py)
+        self.base_url = base_url.rstrip('/')
+        # Границы случайной добавки к паузе перед запросом (секунды)
+        self.jitter = jitter
+        # Запись полученных страниц в архив (SessionRecorder)
+        self.recorder = recorder
 
     # Формирование ссылки на основе запроса
     def build_search_url(self, page=1):
         """Строим URL для поиска на основе параметров"""
-        # Базовый URL
-        base_url = f"https://www.avito.ru/{self.city}/lichnye_veschi"
+        # Базовый URL (тот же, что у ImprovedAvitoParser, чтобы оба способа
+        # получения давали одинаковую выдачу)
+        base_url = f"{self.base_url}/{self.city}"
 
         encoded_query = quote_plus(self.query)
         # Параметр s отвечает за сортировку по дате
@@ -59,10 +83,14 @@ class AvitoParser:
     def get_page(self, url, delay=5):
         """Получаем страницу с со случайной задержкой"""
         print(f"Ждем {delay} секунд перед запросом...")
-        time.sleep(delay + random.uniform(0, 2))
+        time.sleep(delay + random.uniform(*self.jitter))
+        if self.throttle:
+            self.throttle.wait(url)
 
         try:
-            response = self.session.get(url, timeout=10)
+            with metrics.span("http_fetch"):
+                response = self.session.get(url, timeout=10)
+            self.last_status_code = response.status_code
 
             if response.status_code == 200:
                 print("Успешно получили страницу!")
@@ -73,8 +101,42 @@ class AvitoParser:
 
         except Exception as e:
             print(f"Ошибка при запросе: {e}")
+            self.last_status_code = None
             return None
 
+    def fetch_first_page(self, delay=0):
+        """
+        Быстрая проверка первой страницы одним HTTP-запросом.
+        Returns:
+            Кортеж (статус, объявления). Статус: "ok", "empty" (объявлений
+            нет), "blocked" (капча/блокировка) или "error".
+        """
+        url = self.build_search_url(page=1)
+        html = self.get_page(url, delay=delay)
+        if html is None:
+            if self.last_status_code in (403, 429):
+                return "blocked", []
+            return "error", []
+        if self.is_blocked(html):
+            self._record_page(url, html, None, "blocked")
+            return "blocked", []
+
+        items = self.extract_items(html)
+        self._record_page(url, html, items, "ok")
+        return ("ok" if items else "empty"), items
+
+    def _record_page(self, url, html, items, status):
+        """Запись страницы в архив (если задан recorder)"""
+        if self.recorder:
+            self.recorder.record(url=url, html=html, items=items,
+                                 status=status, extraction_mode="http",
+                                 base_url=self.base_url)
+
+    @staticmethod
+    def is_blocked(html):
+        """Проверка страницы на признаки капчи или блокировки"""
+        return any(indicator in html for indicator in BLOCK_INDICATORS)
+
     """Проверяем новые объявления на первой странице"""
 
     def check_new_items(self):
@@ -117,76 +179,12 @@ class AvitoParser:
             # Случайная задержка между страницами
             time.sleep(random.uniform(2, 5))
 
+        return all_items
+
     # Функция извлечения данных со страницы
     def extract_items(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
-        items = []
-
-        # Находим ВСЕ контейнеры объявлений
-        item_containers = soup.find_all('div', {'data-marker': 'item'})
-
-        for container in item_containers:
-            # Извлекаем данные из каждого контейнера
-            item_data = self.parse_item(container)
-            if item_data:
-                items.append(item_data)
-        return items
-
-    # Функция извлечения данных из одного контейнера
-    def parse_item(self, container):
-        try:
-            # 1) Название и ссылка
-            title_elem = container.find('a', {'data-marker': 'item-title'})
-            title = title_elem.text.strip() if title_elem else None
-            link = "https://www.avito.ru" + title_elem['href'] if title_elem else None
-
-            # 2) Цена
-            # Ищем любой элемент с data-marker="item-price" независимо от тега
-            price_container = container.find(attrs={'data-marker': 'item-price'})
-            if price_container:
-                # Поиск meta-тега с itemprop="price"
-                meta_elem = price_container.find('meta', {'itemprop': 'price'})
-                if meta_elem and meta_elem.get('content'):
-                    price = meta_elem['content']
-
-            # Первое фото: ищем тег <img itemprop="image">
-            image_container = container.find('img', {'itemprop': 'image'})
-            image_url = image_container.get('src') if image_container else None
-            # Если фото не найдено, можно использовать заглушку
-            if not image_url:
-                image_url = "No image"
-            # 3) Дата публикации
-            date_elem = container.find(attrs={'data-marker': 'item-date'})
-            date = date_elem.text.strip() if date_elem else None
-
-            # 4) Местоположение товара
-            location_elem = container.find(attrs={'data-marker': 'item-location'})
-            location = location_elem.text.strip() if location_elem else None
-            # 5) Дополнительные параметры (доставка, примерка)
-            extra_elem = container.find('div', {'class': 'iva-item-listMiddleBlock-W7qtU'})
-            if extra_elem and "Доставка" in extra_elem.text:
-                delivery = True
-            else:
-                delivery = False
-
-            if extra_elem and "Можно примерить" in extra_elem.text:
-                fitting = True
-            else:
-                fitting = False
-            return {
-                'title': title,
-                'price': price + " р.",
-                'image_url': image_url,
-                'link': link,
-                'date': date,
-                'delivery': delivery,
-                'location': location,
-                'fitting': fitting
-            }
-
-        except Exception as e:
-            print(f"Ошибка при парсинге объявления: {e}")
-            return None
+        # Общий разборщик HTML: те же поля, что у ImprovedAvitoParser
+        return extract_items(html, self.base_url)
 
 
 if __name__ == "__main__":
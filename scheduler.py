@@ -0,0 +1,241 @@
+"""
+Модуль планировщика фоновых проверок.
+Держит очередь запросов по времени следующей проверки и подстраивает
+интервал каждого запроса под частоту появления новых объявлений:
+"горячие" запросы проверяются чаще, запросы без новых объявлений - реже.
+"""
+import heapq
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class Scheduler:
+    """
+    Планировщик проверок AvitoTracker в отдельном потоке.
+    Args:
+        tracker: AvitoTracker (проверки и база данных).
+        interval: Базовый интервал проверки в минутах (по умолчанию
+            check_interval трекера) - для новых запросов без истории.
+        min_interval, max_interval: Границы адаптивного интервала (минуты).
+        window_days: За сколько дней учитываются найденные объявления.
+        prior_hours: "Вес" базового интервала в оценке частоты: пока у
+            запроса мало истории, интервал близок к базовому.
+        jitter: Случайное отклонение интервала (доля, 0.1 = ±10%).
+        on_check_start: Функция без аргументов - начало проверки.
+        on_check_complete: Функция on_check_complete(кол-во новых
+            объявлений) - конец проверки.
+        dispatch: Функция dispatch(search_ids) вместо проверки в этом
+            процессе - например, постановка в очередь check_jobs для
+            обработчиков (job_queue.py).
+    Колбэки вызываются в потоке планировщика.
+    """
+
+    # Как часто (сек) перечитывается список запросов из базы, чтобы
+    # учесть добавленные и удалённые запросы
+    REFRESH_SECONDS = 60
+
+    def __init__(self, tracker, interval=None, min_interval=5,
+                 max_interval=240, window_days=7, prior_hours=6, jitter=0.1,
+                 on_check_start=None, on_check_complete=None,
+                 dispatch=None):
+        self.tracker = tracker
+        self.db = tracker.db
+        self.interval = interval or tracker.check_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window_days = window_days
+        self.prior_hours = prior_hours
+        self.jitter = jitter
+        self.on_check_start = on_check_start
+        self.on_check_complete = on_check_complete
+        self.dispatch = dispatch
+
+        self.is_running = False  # Идёт ли сейчас проверка
+        self._queue = []  # Куча (время следующей проверки, search_id)
+        self._intervals = {}  # search_id -> текущий интервал (минуты)
+        self._condition = threading.Condition()
+        self._thread = None
+        # Поток, остановленный stop(), может ещё завершать проверку
+        self._last_thread = None
+        self._stop_event = None
+
+    def start(self):
+        """
+        Запускает фоновые проверки (повторный вызов ничего не делает).
+        Пока поток, остановленный stop(), завершает проверку, новый не
+        запускается - иначе два потока проверяли бы одни запросы.
+        Возвращает True, если планировщик запущен.
+        """
+        with self._condition:
+            if self._thread is not None:
+                return True
+            if self._last_thread is not None and \
+                    self._last_thread.is_alive():
+                print("Планировщик не запущен: ещё завершается предыдущая "
+                      "проверка")
+                return False
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run,
+                                            args=(self._stop_event,),
+                                            name="scheduler", daemon=True)
+            self._thread.start()
+        print("Планировщик запущен")
+        return True
+
+    def stop(self, wait=False, timeout=None):
+        """
+        Останавливает фоновые проверки. Текущая проверка не прерывается.
+        Args:
+            wait: Дождаться завершения потока, в том числе остановленного
+                раньше без ожидания (не вызывать из GUI - проверка может
+                идти несколько минут).
+        """
+        with self._condition:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._last_thread = thread
+            if self._stop_event:
+                self._stop_event.set()
+                self._stop_event = None
+            self._condition.notify_all()
+        if thread is not None:
+            print("Планировщик остановлен")
+        # Поток мог быть остановлен раньше без ожидания (кнопка или
+        # закрытие окна) и ещё завершать проверку - ждём и его
+        last_thread = self._last_thread
+        if wait and last_thread is not None:
+            last_thread.join(timeout)
+
+    def get_schedule(self):
+        """Текущее расписание: список (search_id, время следующей проверки
+        (timestamp), интервал в минутах) по возрастанию времени"""
+        with self._condition:
+            return [(search_id, due, self._intervals.get(search_id))
+                    for due, search_id in sorted(self._queue)]
+
+    def _run(self, stop_event):
+        """Цикл потока планировщика"""
+        while not stop_event.is_set():
+            try:
+                self._sync()
+                due_ids = self._wait_for_due(stop_event)
+                if due_ids and not stop_event.is_set():
+                    self._check(due_ids)
+            except Exception as e:
+                print(f"Ошибка планировщика: {e}")
+                stop_event.wait(self.REFRESH_SECONDS)
+
+    def _wait_for_due(self, stop_event):
+        """Ждёт ближайшую проверку (не дольше REFRESH_SECONDS).
+        Возвращает id запросов, чья очередь подошла"""
+        with self._condition:
+            wait = self.REFRESH_SECONDS
+            if self._queue:
+                wait = min(wait, self._queue[0][0] - time.time())
+            if wait > 0:
+                self._condition.wait(wait)
+            if stop_event.is_set():
+                return []
+            due_ids = []
+            now = time.time()
+            while self._queue and self._queue[0][0] <= now:
+                due_ids.append(heapq.heappop(self._queue)[1])
+            return due_ids
+
+    def _check(self, search_ids):
+        """Проверка запросов, чья очередь подошла"""
+        self.is_running = True
+        if self.on_check_start:
+            self.on_check_start()
+        new_items = []
+        try:
+            if self.dispatch:
+                self.dispatch(search_ids)
+            else:
+                new_items = self.tracker.check_all_active_searches(
+                    search_ids=search_ids)
+        finally:
+            self.is_running = False
+            # Новые интервалы с учётом только что найденных объявлений
+            self._sync(checked=search_ids)
+            if self.on_check_complete:
+                self.on_check_complete(len(new_items))
+
+    def _sync(self, checked=()):
+        """
+        Перестраивает очередь по активным запросам из базы.
+        Запросы из checked (только что проверенные) и новые запросы
+        получают новое время проверки, остальные сохраняют прежнее.
+        """
+        now = time.time()
+        since = datetime.fromtimestamp(
+            now, self.db.MSK_TIMEZONE) - timedelta(days=self.window_days)
+        rows = self.db.get_search_activity(since.strftime('%Y-%m-%d %H:%M:%S'))
+
+        with self._condition:
+            scheduled = {search_id: due for due, search_id in self._queue}
+            queue = []
+            intervals = {}
+            for search_id, created_date, last_check, found_count in rows:
+                interval = self._adaptive_interval(created_date, found_count,
+                                                   now)
+                intervals[search_id] = interval
+                if search_id in scheduled and search_id not in checked:
+                    due = scheduled[search_id]
+                else:
+                    # Новый запрос считается от последней проверки
+                    # (если её не было - проверяется сразу)
+                    last = now if search_id in checked \
+                        else self._timestamp(last_check)
+                    if last is None:
+                        due = now
+                    else:
+                        due = last + self._with_jitter(interval) * 60
+                    # Не раньше окончания отсрочки после блокировок
+                    resume = self._resume_time(search_id)
+                    if resume:
+                        due = max(due, resume)
+                queue.append((due, search_id))
+            heapq.heapify(queue)
+            self._queue = queue
+            self._intervals = intervals
+
+    def _resume_time(self, search_id):
+        backoff = getattr(self.tracker, 'backoff', None)
+        return backoff.resume_time(search_id) if backoff else None
+
+    def _adaptive_interval(self, created_date, found_count, now):
+        """
+        Интервал (минуты) из частоты новых объявлений: в среднем одно новое
+        объявление на проверку. Частота оценивается со "сглаживанием" -
+        prior_hours часов с базовой частотой (одно объявление за
+        базовый интервал), поэтому без истории интервал близок к базовому,
+        а без новых объявлений постепенно растёт до max_interval.
+        """
+        created = self._timestamp(created_date)
+        observed_hours = self.window_days * 24
+        if created is not None:
+            observed_hours = min(
+                observed_hours,
+                max(0.0, (now - created) / 3600
+                    - self.db.INITIAL_PARSE_MINUTES / 60))
+        prior_items = self.prior_hours * 60 / self.interval
+        rate = (found_count + prior_items) / (observed_hours + self.prior_hours)
+        interval = 60 / rate if rate > 0 else self.max_interval
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def _with_jitter(self, interval):
+        """Случайное отклонение интервала (проверки не идут "пачкой")"""
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _timestamp(self, value):
+        """Строка времени MSK из базы -> timestamp (или None)"""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(
+                tzinfo=self.db.MSK_TIMEZONE).timestamp()
+        except ValueError:
+            return None
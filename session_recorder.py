@@ -0,0 +1,240 @@
+"""
+Модуль записи и воспроизведения страниц реальных проверок.
+При включённой записи каждая обработанная страница (HTML, время, замеры
+фаз и извлечённые объявления) сохраняется в сжатый архив - один файл
+recordings/<время запуска>.jsonl.gz на сеанс работы программы.
+Воспроизведение прогоняет сохранённые страницы через html_extractor:
+замер скорости извлечения и поиск "дрейфа" селекторов (объявления,
+которые раньше извлекались, а теперь нет или извлекаются иначе).
+
+Запуск:
+    python session_recorder.py replay recordings/*.jsonl.gz [--repeats 3]
+    python session_recorder.py export recordings/x.jsonl.gz [--to test_files]
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from html_extractor import extract_items, BASE_URL
+
+# Режимы извлечения, которые воспроизводятся html_extractor без браузера
+# ("html" - ImprovedAvitoParser из page_source, "http" - AvitoParser).
+# "script" и "elements" берут текст из браузера (innerText) - с разбором
+# BeautifulSoup он не совпадает, поэтому такие страницы только замеряются
+REPLAYABLE_MODES = ("html", "http")
+
+# Поля объявления, которые сравниваются при поиске дрейфа
+COMPARED_FIELDS = ('title', 'price', 'date', 'location', 'delivery',
+                   'fitting', 'image_url', 'description')
+
+
+class SessionRecorder:
+    """
+    Запись страниц в архив сеанса (потокобезопасная).
+    Args:
+        directory: Папка архивов.
+        name: Имя файла архива без расширения (по умолчанию - время
+            создания записи).
+    """
+
+    def __init__(self, directory="recordings", name=None):
+        os.makedirs(directory, exist_ok=True)
+        name = name or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.path = os.path.join(directory, f"{name}.jsonl.gz")
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, url, html, items, status="ok", timings=None,
+               extraction_mode=None, base_url=BASE_URL):
+        """
+        Сохраняет одну страницу.
+        Args:
+            items: Объявления, извлечённые при проверке (до отсечения
+                известных), или None, если страница не разбиралась
+                (капча/блокировка).
+            status: Итог страницы ("ok", "captcha", "blocked", "timeout").
+            timings: Замеры фаз [(фаза, секунды), ...] (TimingPolicy).
+        """
+        entry = {
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+            'url': url,
+            'status': status,
+            'extraction_mode': extraction_mode,
+            'base_url': base_url,
+            'timings': [[name, round(seconds, 3)]
+                        for name, seconds in (timings or [])],
+            'items': items,
+            'html': html,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                if self._file is None:
+                    # Дописывание в gzip создаёт новый "член" архива -
+                    # gzip.open читает такие файлы целиком
+                    self._file = gzip.open(self.path, "at", encoding="utf-8")
+                self._file.write(line)
+                self._file.flush()
+                self.count += 1
+        except OSError as e:
+            print(f"Не удалось записать страницу в архив: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_archive(path):
+    """Генератор записей архива (словари, как в SessionRecorder.record)"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except EOFError:
+            # Архив сеанса, прерванного до закрытия файла: все записанные
+            # строки уже прочитаны
+            return
+
+
+def compare_items(recorded, extracted):
+    """
+    Сравнение объявлений записи и повторного извлечения по ссылкам.
+    Возвращает словарь: missing (ссылки, которые больше не извлекаются),
+    extra (новые ссылки), changed ({поле: количество объявлений}).
+    """
+    recorded_by_link = {item['link']: item for item in recorded}
+    extracted_by_link = {item['link']: item for item in extracted}
+    changed = {}
+    for link, item in recorded_by_link.items():
+        other = extracted_by_link.get(link)
+        if other is None:
+            continue
+        for field in COMPARED_FIELDS:
+            if item.get(field) != other.get(field):
+                changed[field] = changed.get(field, 0) + 1
+    return {
+        'missing': [link for link in recorded_by_link
+                    if link not in extracted_by_link],
+        'extra': [link for link in extracted_by_link
+                  if link not in recorded_by_link],
+        'changed': changed,
+    }
+
+
+def replay(paths, repeats=3):
+    """
+    Прогон записанных страниц через html_extractor.
+    Возвращает список результатов по страницам: url, время извлечения
+    (лучшее из repeats), количество объявлений и дрейф (compare_items;
+    None для страниц, записанных в режиме не из REPLAYABLE_MODES).
+    """
+    results = []
+    for path in paths:
+        for entry in read_archive(path):
+            if entry.get('items') is None:
+                continue  # Капча/блокировка - извлекать нечего
+            base_url = entry.get('base_url') or BASE_URL
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                items = extract_items(entry['html'], base_url)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            mode = entry.get('extraction_mode')
+            drift = compare_items(entry['items'], items) \
+                if mode in REPLAYABLE_MODES else None
+            results.append({
+                'archive': path,
+                'url': entry['url'],
+                'recorded_at': entry['recorded_at'],
+                'extraction_mode': mode,
+                'seconds': best,
+                'recorded_count': len(entry['items']),
+                'count': len(items),
+                'drift': drift,
+            })
+    return results
+
+
+def print_replay_report(results):
+    """Вывод результатов replay: скорость и страницы с дрейфом"""
+    if not results:
+        print("В архивах нет страниц с объявлениями")
+        return
+    total = sum(result['seconds'] for result in results)
+    items = sum(result['count'] for result in results)
+    print(f"Страниц: {len(results)}, объявлений: {items}, "
+          f"извлечение: {total:.3f} с "
+          f"({total / len(results) * 1000:.1f} мс на страницу)")
+
+    not_compared = [result for result in results if result['drift'] is None]
+    if not_compared:
+        modes = sorted({str(result['extraction_mode'])
+                        for result in not_compared})
+        print(f"Без сравнения: {len(not_compared)} страниц записаны в "
+              f"режиме {', '.join(modes)} (извлечение в браузере, "
+              f"html_extractor его не воспроизводит)")
+    drifted = [result for result in results
+               if result['drift'] is not None
+               and any(result['drift'].values())]
+    print(f"Страниц с дрейфом: {len(drifted)}")
+    for result in drifted:
+        drift = result['drift']
+        changed = ", ".join(f"{field}: {count}"
+                            for field, count in drift['changed'].items())
+        print(f"  {result['recorded_at']} {result['url']}\n"
+              f"    было {result['recorded_count']}, "
+              f"стало {result['count']} "
+              f"(пропало {len(drift['missing'])}, "
+              f"появилось {len(drift['extra'])})"
+              + (f", изменились поля - {changed}" if changed else ""))
+
+
+def export_pages(path, directory="test_files"):
+    """Сохраняет страницы архива как HTML-файлы (для benchmark.py и
+    mock_avito.py). Возвращает список созданных файлов"""
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(path).split('.')[0]
+    created = []
+    for index, entry in enumerate(read_archive(path)):
+        if entry.get('items') is None:
+            continue
+        page_path = os.path.join(directory, f"{name}_{index:03d}.html")
+        with open(page_path, "w", encoding="utf-8") as f:
+            f.write(entry['html'])
+        created.append(page_path)
+    return created
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Воспроизведение записанных страниц")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser(
+        "replay", help="скорость извлечения и дрейф селекторов")
+    replay_parser.add_argument("archives", nargs="*")
+    replay_parser.add_argument("--repeats", type=int, default=3)
+
+    export_parser = commands.add_parser(
+        "export", help="сохранить страницы архива как HTML")
+    export_parser.add_argument("archive")
+    export_parser.add_argument("--to", default="test_files")
+
+    args = arg_parser.parse_args()
+    if args.command == "replay":
+        archives = args.archives or sorted(
+            glob.glob("recordings/*.jsonl.gz"))
+        print_replay_report(replay(archives, repeats=args.repeats))
+    else:
+        for page_path in export_pages(args.archive, args.to):
+            print(page_path)
@@ -0,0 +1,120 @@
+"""
+Модуль хранения "прогретых" сессий браузера.
+Сохраняет cookies и localStorage успешной сессии, чтобы следующие
+проверки шли сразу на страницу поиска, минуя главную страницу и
+имитацию поведения пользователя.
+"""
+import json
+import os
+import time
+import weakref
+
+
+class SessionStore:
+    """
+    Хранилище сессий: один JSON-файл на ключ (обычно слот драйвера в пуле).
+    Args:
+        directory: Папка для файлов сессий.
+        warm_minutes: Сколько минут после сохранения сессия считается тёплой.
+    """
+
+    def __init__(self, directory="sessions", warm_minutes=60):
+        self.directory = directory
+        self.warm_seconds = warm_minutes * 60
+        # Драйверы, в которые сессия уже восстановлена
+        self._restored = weakref.WeakSet()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_warm(self, key):
+        """Есть ли для ключа свежая сохранённая сессия"""
+        session = self._load(key)
+        if not session:
+            return False
+        return time.time() - session.get('saved_at', 0) < self.warm_seconds
+
+    def save(self, key, driver):
+        """Сохраняет cookies и localStorage текущей страницы драйвера"""
+        try:
+            session = {
+                'saved_at': time.time(),
+                'origin': driver.execute_script("return location.origin"),
+                'cookies': driver.get_cookies(),
+                'local_storage': driver.execute_script(
+                    "return Object.assign({}, window.localStorage)") or {}
+            }
+            with open(self._path(key), "w", encoding="utf-8") as f:
+                json.dump(session, f, ensure_ascii=False)
+            self._restored.add(driver)
+        except Exception as e:
+            print(f"Не удалось сохранить сессию '{key}': {e}")
+
+    def restore(self, key, driver):
+        """
+        Восстанавливает сессию в драйвер (один раз на драйвер).
+        Возвращает True, если драйвер готов к работе с тёплой сессией.
+        """
+        if driver in self._restored:
+            return True
+        session = self._load(key)
+        if not session:
+            return False
+        try:
+            # Cookies ставятся через CDP без перехода на сайт
+            cookies = []
+            for cookie in session['cookies']:
+                cdp_cookie = {
+                    'name': cookie['name'],
+                    'value': cookie['value'],
+                    'domain': cookie.get('domain'),
+                    'path': cookie.get('path', '/'),
+                    'secure': cookie.get('secure', False),
+                    'httpOnly': cookie.get('httpOnly', False),
+                }
+                if 'expiry' in cookie:
+                    cdp_cookie['expires'] = cookie['expiry']
+                if cookie.get('sameSite'):
+                    cdp_cookie['sameSite'] = cookie['sameSite']
+                cookies.append(cdp_cookie)
+            driver.execute_cdp_cmd('Network.setCookies', {'cookies': cookies})
+
+            # localStorage заполняется до выполнения кода сайта
+            if session['local_storage']:
+                driver.execute_cdp_cmd(
+                    'Page.addScriptToEvaluateOnNewDocument', {
+                        'source': '''
+                            (() => {
+                                if (location.origin !== %s) return;
+                                const data = %s;
+                                for (const [k, v] of Object.entries(data)) {
+                                    if (localStorage.getItem(k) === null) {
+                                        localStorage.setItem(k, v);
+                                    }
+                                }
+                            })();
+                        ''' % (json.dumps(session['origin']),
+                               json.dumps(session['local_storage']))
+                    })
+            self._restored.add(driver)
+            return True
+        except Exception as e:
+            print(f"Не удалось восстановить сессию '{key}': {e}")
+            return False
+
+    def invalidate(self, key, driver=None):
+        """Удаляет сессию (например, после капчи или блокировки)"""
+        if driver is not None:
+            self._restored.discard(driver)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,127 @@
+"""
+Проверка планов запросов Database к таблице items: каждый метод должен
+читать items по индексу, а не полным просмотром таблицы.
+SQL берётся из настоящих методов (set_trace_callback), а не копируется
+в тест, поэтому изменение запроса или индекса в database.py сразу
+проверяется.
+
+Запуск: python -m unittest test_query_plans
+"""
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from database import Database
+
+# Операции над items, план которых проверяется (вставки не проверяются)
+ITEMS_STATEMENT = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b.*\bitems\b',
+                             re.IGNORECASE | re.DOTALL)
+# Полный просмотр items (псевдоним i в подзапросах)
+FULL_SCAN = re.compile(r'^SCAN (items|i)\b')
+
+
+class QueryPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.directory, "plans.db"))
+        self.search_id = self.db.add_search(query="куртка", city="moskva",
+                                            name="Тест")
+        self.db.add_items([{
+            'link': f"https://www.avito.ru/moskva/odezhda/kurtka_{index}",
+            'title': f"Куртка {index}", 'price': "1 000 ₽",
+            'image_url': None, 'date': None, 'location': None,
+            'delivery': 0, 'fitting': 0, 'description': None,
+        } for index in range(20)], self.search_id)
+        # Статистика для планировщика, как в рабочей базе
+        self.db._get_connection().execute('ANALYZE')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def capture(self, call):
+        """SQL-запросы к items, выполненные call()"""
+        statements = []
+        conn = self.db._get_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        return [sql for sql in statements if ITEMS_STATEMENT.match(sql)]
+
+    def assert_uses_index(self, call, index, sorted_by_index=True):
+        statements = self.capture(call)
+        self.assertTrue(statements, "метод не обратился к items")
+        conn = self.db._get_connection()
+        for sql in statements:
+            plan = [row[-1] for row in
+                    conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()]
+            details = '; '.join(plan)
+            self.assertFalse(any(FULL_SCAN.match(detail) for detail in plan),
+                             f"полный просмотр items: {details}\n{sql}")
+            self.assertTrue(re.search(rf'\b{index}\b', details),
+                            f"не использует {index}: {details}\n{sql}")
+            if sorted_by_index:
+                self.assertNotIn('TEMP B-TREE', details,
+                                 f"сортировка без индекса: {details}")
+
+    def test_get_items_page(self):
+        self.assert_uses_index(
+            lambda: self.db.get_items_page(self.search_id, limit=5),
+            'idx_items_search_found')
+
+    def test_get_items_page_after_cursor(self):
+        self.assert_uses_index(
+            lambda: self.db.get_items_page(
+                self.search_id, limit=5,
+                after=('2100-01-01 00:00:00', 10 ** 9)),
+            'idx_items_search_found')
+
+    def test_get_search_history(self):
+        self.assert_uses_index(
+            lambda: self.db.get_search_history(self.search_id, limit=5),
+            'idx_items_search_found')
+
+    def test_get_items_by_search_id(self):
+        self.assert_uses_index(
+            lambda: self.db.get_items_by_search_id(self.search_id),
+            'idx_items_search_found')
+
+    def test_get_search_activity(self):
+        self.assert_uses_index(
+            lambda: self.db.get_search_activity('2000-01-01 00:00:00'),
+            'idx_items_search_found')
+
+    def test_mark_items_as_viewed(self):
+        self.assert_uses_index(
+            lambda: self.db.mark_items_as_viewed(self.search_id),
+            'idx_items_search_new')
+
+    def test_mark_selected_items_as_viewed(self):
+        self.assert_uses_index(
+            lambda: self.db.mark_items_as_viewed(self.search_id, [1, 2]),
+            'INTEGER PRIMARY KEY')
+
+    def test_add_items_known_check(self):
+        item = {'link': "https://www.avito.ru/moskva/odezhda/kurtka_999",
+                'title': "Куртка", 'price': None, 'image_url': None,
+                'date': None, 'location': None, 'delivery': 0, 'fitting': 0,
+                'description': None}
+        self.assert_uses_index(
+            lambda: self.db.add_items([item], self.search_id),
+            'sqlite_autoindex_items_1')
+
+    def test_filter_known_links(self):
+        self.assert_uses_index(
+            lambda: self.db.filter_known_links(
+                ["https://www.avito.ru/moskva/odezhda/kurtka_1"],
+                self.search_id),
+            'sqlite_autoindex_items_1')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+"""
+Модуль ограничения частоты запросов к одному домену.
+Используется при параллельной проверке запросов: сколько бы потоков ни
+работало, загрузки страниц одного сайта идут не чаще заданного интервала.
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class DomainThrottle:
+    """
+    Минимальный интервал между началом загрузок страниц одного домена.
+    Общий для всех потоков (потокобезопасный).
+    Args:
+        min_interval: Минимум секунд между запросами к одному домену.
+    """
+
+    def __init__(self, min_interval=5.0):
+        self.min_interval = min_interval
+        self._next_allowed = {}  # домен -> время (monotonic) след. запроса
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Блокируется, пока не подойдёт очередь запроса к домену url.
+        Возвращает время ожидания в секундах."""
+        domain = urlsplit(url).hostname or ""
+        # Очередь занимается под блокировкой, а ожидание идёт вне её,
+        # поэтому потоки получают время запроса в порядке обращения
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_allowed.get(domain, now))
+            self._next_allowed[domain] = start + self.min_interval
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
@@ -0,0 +1,122 @@
+"""
+Модуль политики ожиданий для ImprovedAvitoParser.
+Вместо фиксированных пауз ждёт реальных сигналов готовности страницы
+(DOMContentLoaded, первое объявление, затишье сети) и оставляет только
+небольшую случайную паузу (нижний порог "человечности").
+"""
+import time
+import random
+from contextlib import contextmanager
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+import metrics
+
+
+class TimingPolicy:
+    """
+    Настройки ожиданий и замер длительности фаз загрузки.
+    Args:
+        min_jitter, max_jitter: Границы случайной паузы после готовности
+            страницы (секунды). min_jitter - минимальный порог.
+        page_timeout: Максимум ожидания DOMContentLoaded.
+        items_timeout: Максимум ожидания первого объявления (или капчи).
+        idle_window: Сколько секунд без новых сетевых запросов считается
+            затишьем сети.
+        idle_timeout: Максимум ожидания затишья сети.
+        poll_interval: Период опроса страницы.
+        human_behavior: Выполнять ли имитацию действий пользователя.
+        scroll_pause, click_pause: Паузы при имитации (диапазоны секунд).
+        page_delay: Пауза между страницами результатов.
+        empty_grace: Сколько секунд полностью загруженная страница без
+            объявлений и без признаков пустой выдачи ждёт их появления,
+            прежде чем проверка завершается таймаутом.
+    """
+
+    def __init__(self, min_jitter=1.0, max_jitter=3.0, page_timeout=30,
+                 items_timeout=30, idle_window=0.5, idle_timeout=10,
+                 poll_interval=0.5, human_behavior=True,
+                 scroll_pause=(0.2, 0.6), click_pause=(0.5, 1.5),
+                 page_delay=(10, 20), empty_grace=5):
+        self.min_jitter = min_jitter
+        self.max_jitter = max(max_jitter, min_jitter)
+        self.page_timeout = page_timeout
+        self.items_timeout = items_timeout
+        self.idle_window = idle_window
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.human_behavior = human_behavior
+        self.scroll_pause = scroll_pause
+        self.click_pause = click_pause
+        self.page_delay = page_delay
+        self.empty_grace = empty_grace
+        self.timings = []  # Список (фаза, секунды) текущего запуска
+
+    @contextmanager
+    def phase(self, name):
+        """Замер длительности фазы (результат попадает в self.timings и
+        в гистограмму фаз metrics)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings.append((name, seconds))
+            metrics.observe(metrics.PHASE_SECONDS, seconds, phase=name)
+
+    def log_timings(self):
+        """Выводит длительность фаз и очищает накопленные замеры"""
+        if not self.timings:
+            return
+        parts = [f"{name} {seconds:.1f} с" for name, seconds in self.timings]
+        total = sum(seconds for _, seconds in self.timings)
+        print(f"Фазы: {' | '.join(parts)} (всего {total:.1f} с)")
+        self.timings = []
+
+    def jitter(self):
+        """Случайная пауза не меньше min_jitter"""
+        time.sleep(random.uniform(self.min_jitter, self.max_jitter))
+
+    def pause(self, bounds):
+        """Случайная пауза в заданном диапазоне (min, max)"""
+        time.sleep(random.uniform(*bounds))
+
+    def wait_dom_ready(self, driver):
+        """Ожидание DOMContentLoaded. Возвращает True/False"""
+        return self._wait(
+            driver, self.page_timeout,
+            lambda d: d.execute_script("return document.readyState")
+            in ("interactive", "complete"))
+
+    def wait_network_idle(self, driver):
+        """
+        Ожидание затишья сети: количество загруженных ресурсов
+        (performance entries) не меняется в течение idle_window.
+        Возвращает True/False
+        """
+        deadline = time.monotonic() + self.idle_timeout
+        last_count = -1
+        stable_since = time.monotonic()
+        while time.monotonic() < deadline:
+            try:
+                count = driver.execute_script(
+                    "return performance.getEntriesByType('resource').length")
+            except Exception:
+                return False
+            now = time.monotonic()
+            if count != last_count:
+                last_count = count
+                stable_since = now
+            elif now - stable_since >= self.idle_window:
+                return True
+            time.sleep(min(self.poll_interval, self.idle_window))
+        return False
+
+    def _wait(self, driver, timeout, condition):
+        try:
+            WebDriverWait(driver, timeout,
+                          poll_frequency=self.poll_interval).until(condition)
+            return True
+        except TimeoutException:
+            return False
@@ -1,13 +1,176 @@
-from improvedParser import ImprovedAvitoParser
+import copy
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+from improvedParser import ImprovedAvitoParser, create_driver, parse_in_tabs
+from html_extractor import BASE_URL
+from parser import AvitoParser
 from database import Database
+from throttle import DomainThrottle
+from backoff import BackoffController
+import metrics
 import notification as my_notifications
 
+# Интервал между запросами к одному домену при параллельной проверке (сек)
+DEFAULT_DOMAIN_INTERVAL = 5.0
+
+# Параметры цены в URL поиска
+PRICE_PARAMS = ('pmin', 'pmax')
+
+
+def canonical_search_url(url, drop_params=()):
+    """
+    Канонический вид URL поиска: регистр и пробелы в запросе не важны,
+    параметры отсортированы, пустые параметры и drop_params отброшены.
+    Запросы с одинаковым каноническим URL дают одинаковую выдачу.
+    """
+    parts = urlsplit(url)
+    params = []
+    for key, value in parse_qsl(parts.query):
+        if key in drop_params or value == "":
+            continue
+        if key == 'q':
+            value = ' '.join(value.casefold().split())
+        params.append((key, value))
+    params.sort()
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path.lower().rstrip('/'), urlencode(params), ''))
+
+
+def _price_range_contains(outer, inner):
+    """Диапазон цен outer (min, max; None - без границы) включает inner"""
+    low_ok = outer[0] is None or (inner[0] is not None and
+                                  outer[0] <= inner[0])
+    high_ok = outer[1] is None or (inner[1] is not None and
+                                   inner[1] <= outer[1])
+    return low_ok and high_ok
+
+
+def plan_fetches(searches):
+    """
+    Группировка запросов (кортежей из searches) для одной загрузки выдачи.
+    Запросы с одинаковым URL без учёта цены попадают в одну группу, если
+    диапазон цен одного запроса вложен в диапазон другого: загружается
+    самый широкий запрос (первый в группе), остальные фильтруются
+    локально (filter_by_price). Название и fitting на URL не влияют.
+    Возвращает список групп (списков запросов).
+    """
+    groups = {}  # URL без цены -> список групп
+    for search in searches:
+        url = ImprovedAvitoParser(city=search[3], query=search[2],
+                                  delivery=bool(search[6]))._build_search_url()
+        key = canonical_search_url(url, drop_params=PRICE_PARAMS)
+        groups.setdefault(key, []).append(search)
+
+    plan = []
+    for same_url in groups.values():
+        # Сначала самые широкие диапазоны: без нижней границы и с
+        # наибольшей верхней
+        same_url.sort(key=lambda search: (
+            search[4] is not None, search[4] or 0,
+            search[5] is not None, -(search[5] or 0)))
+        url_groups = []
+        for search in same_url:
+            for group in url_groups:
+                if _price_range_contains((group[0][4], group[0][5]),
+                                         (search[4], search[5])):
+                    group.append(search)
+                    break
+            else:
+                url_groups.append([search])
+        plan.extend(url_groups)
+    return plan
+
+
+def parse_price(price):
+    """Цена из текста объявления ("12 000 ₽") -> int или None"""
+    digits = re.sub(r'\D', '', price or '')
+    return int(digits) if digits else None
+
+
+def filter_by_price(items, search, fetched):
+    """
+    Объявления из выдачи запроса fetched, подходящие запросу search по
+    цене. Объявления без цены остаются (их пропустил фильтр сайта).
+    """
+    price_min, price_max = search[4], search[5]
+    if (price_min, price_max) == (fetched[4], fetched[5]):
+        return items
+    result = []
+    for item in items:
+        price = parse_price(item.get('price'))
+        if price is not None:
+            if price_min is not None and price < price_min:
+                continue
+            if price_max is not None and price > price_max:
+                continue
+        result.append(item)
+    return result
+
 
 class AvitoTracker:
-    def __init__(self, db, check_interval_minutes=15):
+    def __init__(self, db, check_interval_minutes=15, driver_pool=None,
+                 session_store=None, tabs_per_driver=1, use_http=False,
+                 max_workers=1, domain_interval=None, backoff=None,
+                 base_url=BASE_URL, timing=None, notify=True,
+                 recorder=None, metrics_path=None, headless=True,
+                 block_resources=False, block_css=False):
         self.db = db
         self.check_interval = check_interval_minutes
         self.is_running = False
+        # Пул "тёплых" браузеров (DriverPool). Без пула каждая проверка
+        # запускает и закрывает собственный Chrome
+        self.driver_pool = driver_pool
+        # Хранилище тёплых сессий (SessionStore) - позволяет не заходить
+        # на главную страницу при каждой проверке
+        self.session_store = session_store
+        # Сколько запросов проверяется одновременно во вкладках одного браузера
+        self.tabs_per_driver = tabs_per_driver
+        # Сначала пробовать быстрый HTTP-запрос (AvitoParser) и только при
+        # пустой выдаче или ошибке запускать браузер (блокировка HTTP -
+        # итог проверки, её учитывает BackoffController)
+        self.use_http = use_http
+        self.http_session = requests.Session() if use_http else None
+        # Сколько проверок выполняется одновременно (по потоку и браузеру
+        # на проверку; с пулом драйверов - не больше размера пула)
+        self.max_workers = max_workers
+        # Не чаще одного запроса к домену в domain_interval секунд (общий
+        # лимит для всех потоков)
+        if domain_interval is None and max_workers > 1:
+            domain_interval = DEFAULT_DOMAIN_INTERVAL
+        self.throttle = DomainThrottle(domain_interval) \
+            if domain_interval else None
+        # Адрес сайта (для локального тестового сервера - mock_avito.py)
+        self.base_url = base_url
+        # Политика ожиданий для парсеров (TimingPolicy; каждый парсер
+        # получает свою копию). None - настройки парсеров по умолчанию
+        self.timing = timing
+        # Показывать ли уведомления о новых объявлениях
+        self.notify = notify
+        # Запись страниц проверок в архив (SessionRecorder) для
+        # повторного прогона извлечения (session_recorder.py replay)
+        self.recorder = recorder
+        # Файл, в который после каждого цикла сохраняются метрики (JSON,
+        # см. metrics.py). None - метрики только в памяти процесса
+        self.metrics_path = metrics_path
+        # Настройки браузеров, которые запускает сам трекер (без пула или
+        # для первоначального парсинга). У пула они задаются в DriverPool;
+        # headless также определяет, ждать ли ручного решения капчи
+        self.headless = headless
+        self.block_resources = block_resources
+        self.block_css = block_css
+        # Отсрочка проверок после капчи/блокировок (BackoffController);
+        # backoff=False - без отсрочек
+        if backoff is None:
+            backoff = BackoffController(db)
+        self.backoff = backoff or None
+        # Итоги последнего цикла проверки: по словарю на запрос
+        # (search_id, name, status, new_items, error, seconds)
+        self.last_cycle_report = []
 
     def create_search(self, query, city, price_min=None,
                       price_max=None, delivery=False, fitting=False,
@@ -36,9 +199,12 @@ class AvitoTracker:
             price_min=price_min,
             price_max=price_max,
             delivery=delivery,
+            base_url=self.base_url,
+            block_resources=self.block_resources,
+            block_css=self.block_css,
         )
         # Полный парсинг страницы для начальной базы
-        items = parser.main_parse_func(headless=True)
+        items = parser.main_parse_func(headless=self.headless)
         new_items = self.db.process_items(items, search_id)
 
         # Обновление времени проверки
@@ -52,61 +218,428 @@ class AvitoTracker:
         Проверка одного запроса - принимает id запроса.
         Возвращает список найденных объявлений. Между вызовами 10 минут минимум.
         '''
+        return self._run_check(search_id)['new_items']
+
+    def _run_check(self, search_id):
+        '''
+        Проверка одного запроса с итогом для отчёта.
+        Возвращает словарь: search_id, name, status ("ok", "empty",
+        "blocked", "timeout", "error", "not_found", "no_driver",
+        "skipped"), new_items, error, seconds.
+        '''
         search = self.db.get_search_by_id(search_id)
         if not search:
             print(f"Поисковый запрос с ID {search_id} не найден")
-            return []
+            return self._report_not_found(search_id)
+        searches, skipped = self._apply_backoff([search])
+        if skipped:
+            return skipped[0]
+        return self._run_group(searches)[0]
 
+    def _run_group(self, group):
+        '''
+        Одна загрузка выдачи для группы запросов (см. plan_fetches):
+        загружается выдача первого запроса группы, остальные получают
+        её часть по своему диапазону цен.
+        Возвращает список итогов по запросам группы.
+        '''
+        started = time.monotonic()
         # Распаковка кортежа (обращаемся по индексам)
         # Порядок колонок в таблице searches:
         # 0: id, 1: name, 2: query, 3: city, 4: price_min, 5: price_max,
-        # 6: delivery, 7: fitting, 8: is_active, 9: created_date, 10: last_check
+        # 6: delivery, 7: fitting, 8: is_active, 9: created_date, 10: last_check,
+        # 11: last_tier
+        search = group[0]
         search_name = search[1]
+        driver = None
+        parser = None
+        # Цепь разомкнута после серии блокировок - загрузка откладывается
+        if self.backoff and not self.backoff.allow_fetch():
+            return self._fan_out(group, [], "skipped", None, started,
+                                 error="пауза после блокировок")
         # Создание парсера для запроса
         try:
-            parser = ImprovedAvitoParser(
-                city=search[3],
-                query=search[2],
-                price_min=search[4],
-                price_max=search[5],
-                delivery=bool(search[6])
-            )
+            # Быстрая проверка без браузера
+            if self.use_http:
+                status, items = self._fetch_via_http(search)
+                if status in ("ok", "blocked"):
+                    return self._fan_out(group, items, status, "http",
+                                         started)
 
-            # Парсинг 1-ой страницы (недавние объявления)
-            items = parser.main_parse_func(headless=True)
-            new_items = self.db.process_items(items, search_id)
+            # Аренда драйвера из пула (если пул настроен)
+            if self.driver_pool:
+                driver = self.driver_pool.acquire()
+                if not driver:
+                    print(f"Нет свободного драйвера для '{search_name}'")
+                    return self._fan_out(group, [], "no_driver", None,
+                                         started)
 
-            # Обновление времени проверки
-            self.db.update_last_check(search_id)
+            parser = self._make_parser(search, driver)
 
-            print(f"Для '"
-                  f"{search_name}' найдено {len(new_items)} новых объявлений")
-
-            # # Показ уведомлений о новых объявлениях
-            if new_items:
-                my_notifications.notify_new_items(search_name, new_items)
-            return new_items
+            # Парсинг 1-ой страницы (недавние объявления)
+            items = parser.main_parse_func(headless=self.headless)
+            return self._fan_out(group, items, parser.last_status or "ok",
+                                 "browser", started)
 
         except Exception as e:
             error_msg = f"Ошибка при проверке запроса '{search_name}': {str(e)}"
             print(f"{error_msg}")
             # notification.notify_error(error_msg, search_name)
-            return []
+            return self._fan_out(group, [], "error", None, started,
+                                 error=str(e))
+        finally:
+            # Возврат драйвера в пул (состояние проверится при след. аренде)
+            if driver:
+                pages = parser.pages_loaded if parser else 0
+                self.driver_pool.release(driver, pages=pages)
+
+    def _fan_out(self, group, items, status, tier, started, error=None):
+        '''
+        Раздача результата загрузки запросам группы: каждый запрос получает
+        объявления своего диапазона цен, сохраняет их и попадает в отчёт.
+        Результаты сохраняются только при статусе "ok"/"empty".
+        '''
+        fetched = group[0]
+        results = []
+        if self.backoff and status != "skipped":
+            self.backoff.record([search[0] for search in group], status)
+        for search in group:
+            result = {'search_id': search[0], 'name': search[1],
+                      'status': status, 'new_items': [], 'error': error,
+                      'seconds': 0.0}
+            if status in ("ok", "empty"):
+                try:
+                    own_items = filter_by_price(items, search, fetched)
+                    result['new_items'] = self._save_results(search,
+                                                             own_items,
+                                                             tier=tier)
+                except Exception as e:
+                    print(f"Ошибка при сохранении запроса '{search[1]}': {e}")
+                    result.update(status="error", error=str(e))
+            result['seconds'] = time.monotonic() - started
+            results.append(result)
+            metrics.observe(metrics.CHECK_SECONDS, result['seconds'],
+                            status=result['status'])
+            metrics.inc(metrics.CHECKS_TOTAL, status=result['status'])
+            metrics.inc(metrics.NEW_ITEMS_TOTAL, len(result['new_items']))
+        return results
+
+    def _apply_backoff(self, searches):
+        """Отбрасывает запросы, отложенные после неудач.
+        Возвращает (запросы для проверки, итоги "skipped" отложенных)"""
+        if not self.backoff:
+            return searches, []
+        allowed = []
+        skipped = []
+        for search in searches:
+            if self.backoff.allow_search(search[0]):
+                allowed.append(search)
+            else:
+                skipped.append({'search_id': search[0], 'name': search[1],
+                                'status': "skipped", 'new_items': [],
+                                'error': "отсрочка после неудач",
+                                'seconds': 0.0})
+        return allowed, skipped
+
+    def _report_not_found(self, search_id):
+        return {'search_id': search_id, 'name': None, 'status': "not_found",
+                'new_items': [], 'error': None, 'seconds': 0.0}
+
+    def _make_parser(self, search, driver=None):
+        """Создание парсера для запроса (кортеж из таблицы searches)"""
+        return ImprovedAvitoParser(
+            city=search[3],
+            query=search[2],
+            price_min=search[4],
+            price_max=search[5],
+            delivery=bool(search[6]),
+            driver=driver,
+            session_store=self.session_store,
+            session_key=self._session_key(driver),
+            # Известные объявления - среди сохранённых загружаемым запросом
+            # (он получает всю выдачу группы)
+            known_links=lambda links: self.db.filter_known_links(
+                links, search[0]),
+            throttle=self.throttle,
+            base_url=self.base_url,
+            timing=self._parser_timing(),
+            recorder=self.recorder,
+            block_resources=self.block_resources,
+            block_css=self.block_css
+        )
+
+    def _parser_timing(self):
+        """Копия общей политики ожиданий для одного парсера (замеры фаз у
+        каждого парсера свои)"""
+        if self.timing is None:
+            return None
+        timing = copy.copy(self.timing)
+        timing.timings = []
+        return timing
+
+    def _fetch_via_http(self, search):
+        """
+        Загрузка выдачи запроса одним HTTP-запросом.
+        Возвращает (статус, объявления). "ok" и "blocked" - итог проверки
+        (блокировку должен учесть BackoffController, браузер с того же
+        адреса не запускается); при пустой выдаче или ошибке сети нужен
+        браузер.
+        """
+        parser = AvitoParser(
+            city=search[3],
+            query=search[2],
+            price_min=search[4],
+            price_max=search[5],
+            delivery=bool(search[6]),
+            session=self.http_session,
+            throttle=self.throttle,
+            base_url=self.base_url,
+            recorder=self.recorder
+        )
+        if self.timing is not None:
+            parser.jitter = (self.timing.min_jitter, self.timing.max_jitter)
+        status, items = parser.fetch_first_page()
+        if status == "blocked":
+            print(f"HTTP-проверка '{search[1]}': блокировка")
+        elif status != "ok":
+            print(f"HTTP-проверка '{search[1]}': {status}, запуск браузера")
+        return status, items
+
+    def _save_results(self, search, items, tier=None):
+        """Сохранение результатов проверки запроса и показ уведомлений.
+        Возвращает список новых объявлений"""
+        search_id, search_name = search[0], search[1]
+        with metrics.span("db_ingest"):
+            new_items = self.db.process_items(items, search_id)
+
+            # Обновление времени проверки (и способа, которым она удалась)
+            self.db.update_last_check(search_id, tier=tier)
+
+        print(f"Для '"
+              f"{search_name}' найдено {len(new_items)} новых объявлений")
+
+        # # Показ уведомлений о новых объявлениях
+        if new_items and self.notify:
+            with metrics.span("notification"):
+                my_notifications.notify_new_items(search_name, new_items)
+        return new_items
+
+    def check_searches_in_tabs(self, search_ids):
+        '''
+        Проверка нескольких запросов в одном браузере (по вкладке на запрос).
+        Возвращает список новых объявлений по всем запросам.
+        '''
+        searches, results = self._load_searches(search_ids)
+        searches, skipped = self._apply_backoff(searches)
+        results.extend(skipped)
+        results.extend(self._run_groups_in_tabs(plan_fetches(searches)))
+        all_new_items = []
+        for result in results:
+            all_new_items.extend(result['new_items'])
+        return all_new_items
+
+    def _run_groups_in_tabs(self, groups):
+        '''
+        Проверка нескольких групп запросов во вкладках одного браузера
+        (по вкладке на группу, см. plan_fetches).
+        Возвращает список итогов по запросам (как _run_check).
+        '''
+        started = time.monotonic()
+        results = []
+
+        # Цепь разомкнута после серии блокировок - загрузки откладываются
+        if self.backoff and not self.backoff.allow_fetch():
+            for group in groups:
+                results.extend(self._fan_out(group, [], "skipped", None,
+                                             started,
+                                             error="пауза после блокировок"))
+            return results
+
+        # Группы, успешно загруженные по HTTP, браузер не открывают
+        if self.use_http:
+            remaining = []
+            for group in groups:
+                status, items = self._fetch_via_http(group[0])
+                if status in ("ok", "blocked"):
+                    results.extend(
+                        self._fan_out(group, items, status, "http", started))
+                else:
+                    remaining.append(group)
+            groups = remaining
+        if not groups:
+            return results
+
+        # Драйвер из пула или собственный (закрывается после проверки)
+        if self.driver_pool:
+            driver = self.driver_pool.acquire()
+        else:
+            driver = create_driver(headless=self.headless,
+                                   block_resources=self.block_resources,
+                                   block_css=self.block_css)
+        if not driver:
+            print("Не удалось получить драйвер для проверки во вкладках")
+            for group in groups:
+                results.extend(
+                    self._fan_out(group, [], "no_driver", None, started))
+            return results
+
+        parsers = [self._make_parser(group[0], driver) for group in groups]
+        try:
+            tab_results = parse_in_tabs(driver, parsers,
+                                        headless=self.headless)
+            for group, parser, items in zip(groups, parsers, tab_results):
+                if items is None:
+                    print(f"Не удалось проверить запрос '{group[0][1]}'")
+                    # Вкладка без причины блокировки упала с обычной
+                    # ошибкой - она не должна размыкать общую цепь
+                    if parser.block_reason in ("captcha", "blocked"):
+                        status = "blocked"
+                    elif parser.block_reason == "timeout":
+                        status = "timeout"
+                    else:
+                        status = "error"
+                    results.extend(
+                        self._fan_out(group, [], status, None, started))
+                    continue
+                results.extend(self._fan_out(
+                    group, items, "ok" if items else "empty", "browser",
+                    started))
+        finally:
+            if self.driver_pool:
+                pages = sum(parser.pages_loaded for parser in parsers)
+                self.driver_pool.release(driver, pages=pages)
+            else:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass  # Игнорируем любые ошибки при закрытии
+        return results
+
+    def _load_searches(self, search_ids):
+        """Кортежи запросов по id. Возвращает (найденные запросы, итоги
+        "not_found" для отсутствующих)"""
+        searches = []
+        missing = []
+        for search_id in search_ids:
+            search = self.db.get_search_by_id(search_id)
+            if search:
+                searches.append(search)
+            else:
+                missing.append(self._report_not_found(search_id))
+        return searches, missing
+
+    def _session_key(self, driver):
+        """Ключ сессии: слот драйвера в пуле или общий ключ без пула"""
+        if self.driver_pool and driver:
+            return self.driver_pool.key_of(driver)
+        return "default"
 
     # Проверка всех активных запросов - возвращ. новые объявления по всем
     # запросам
-    def check_all_active_searches(self):
-        active_searches = self.db.get_active_searches()
-        all_new_items = []
+    # (tabs_per_driver - сколько запросов проверять во вкладках одного
+    # браузера, max_workers - сколько проверок выполнять одновременно;
+    # по умолчанию из настроек трекера; search_ids - проверить только эти
+    # запросы, например те, чья очередь подошла в планировщике)
+    # Запросы с одинаковой или вложенной выдачей загружаются один раз
+    # за цикл (см. plan_fetches)
+    def check_all_active_searches(self, tabs_per_driver=None,
+                                  max_workers=None, search_ids=None):
+        if search_ids is None:
+            searches = self.db.get_active_searches()
+            report = []
+        else:
+            searches, report = self._load_searches(search_ids)
+        # Отложенные после неудач запросы в этом цикле не загружаются
+        searches, skipped = self._apply_backoff(searches)
+        report.extend(skipped)
+        tabs_per_driver = tabs_per_driver or self.tabs_per_driver
+        max_workers = max_workers or self.max_workers
+        started = time.monotonic()
+
+        groups = plan_fetches(searches)
+        if len(groups) < len(searches):
+            print(f"Загрузок выдачи: {len(groups)} на {len(searches)} "
+                  f"запросов")
+
+        # Единица работы - одна группа или пачка групп во вкладках
+        if tabs_per_driver > 1:
+            batches = [groups[start:start + tabs_per_driver]
+                       for start in range(0, len(groups), tabs_per_driver)]
+            run = self._run_groups_in_tabs
+        else:
+            batches = groups
+            run = self._run_group
 
-        for search in active_searches:
-            search_id = search[0]
-            # Проверяем только новые объявления (1 страница)
-            new_items = self.check_search(search_id)
-            all_new_items.extend(new_items)
+        if max_workers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers,
+                                    thread_name_prefix="check") as executor:
+                futures = {executor.submit(self._run_in_pool, run, batch):
+                           batch for batch in batches}
+                for future in as_completed(futures):
+                    report.extend(self._collect(future.result, futures[future]))
+        else:
+            for batch in batches:
+                report.extend(self._collect(lambda: run(batch), batch))
 
+        report.sort(key=lambda result: result['search_id'])
+        self.last_cycle_report = report
+        seconds = time.monotonic() - started
+        self._print_cycle_report(report, seconds)
+        metrics.observe(metrics.CYCLE_SECONDS, seconds)
+        if self.metrics_path:
+            try:
+                metrics.registry.write_json(self.metrics_path)
+            except OSError as e:
+                print(f"Не удалось сохранить метрики: {e}")
+
+        all_new_items = []
+        for result in report:
+            all_new_items.extend(result['new_items'])
         return all_new_items
 
+    def _run_in_pool(self, run, batch):
+        """Проверка в потоке пула: соединение потока с базой закрывается
+        после проверки"""
+        try:
+            return run(batch)
+        finally:
+            self.db.release_thread_connection()
+
+    def _collect(self, get_results, batch):
+        """Итоги проверки группы (или пачки групп); непредвиденная ошибка
+        записывается в отчёт по каждому запросу"""
+        try:
+            return get_results()
+        except Exception as e:
+            # Группа - список кортежей запросов, пачка - список групп
+            searches = batch if isinstance(batch[0], tuple) else \
+                [search for group in batch for search in group]
+            print(f"Ошибка при проверке запросов "
+                  f"{[search[0] for search in searches]}: {e}")
+            return [{'search_id': search[0], 'name': search[1],
+                     'status': "error", 'new_items': [], 'error': str(e),
+                     'seconds': 0.0}
+                    for search in searches]
+
+    def _print_cycle_report(self, report, seconds):
+        """Вывод итогов цикла проверки по каждому запросу"""
+        succeeded = [result for result in report
+                     if result['status'] in ("ok", "empty")]
+        skipped = [result for result in report
+                   if result['status'] == "skipped"]
+        failed = len(report) - len(succeeded) - len(skipped)
+        print(f"Цикл проверки: {len(report)} запросов за {seconds:.0f} с, "
+              f"успешно: {len(succeeded)}, с ошибкой: {failed}, "
+              f"отложено: {len(skipped)}")
+        for result in report:
+            name = result['name'] or f"ID {result['search_id']}"
+            line = (f"  {name}: {result['status']}, "
+                    f"новых: {len(result['new_items'])}, "
+                    f"{result['seconds']:.0f} с")
+            if result['error']:
+                line += f" ({result['error']})"
+            print(line)
+
 
 if __name__ == "__main__":
     tracker = AvitoTracker()